@@ -0,0 +1,191 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Automatic RGB threshold search. A handful of sampled frames are blurred and downscaled once    *
+* and stacked into one image, so every candidate costs a single inRange/open/connected-          *
+* components pass over the stack. A coarse interval grid is scored in parallel processes and     *
+* the best candidate is refined bound by bound with shrinking steps.                             *
+*                                                                                                *
+* Usage: python centrifuge_autotune.py video/v7.avi -j 0                                         *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import sys
+import itertools
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+from centrifuge_tracker import CAM_SETTINGS, VIDEO_SETTINGS, DEFAULT_LOWER, DEFAULT_UPPER, crop_roi, threshold_bounds
+from centrifuge_video import is_frame_cache, open_video
+
+
+PRESETS = {'cam': CAM_SETTINGS, 'video': VIDEO_SETTINGS}
+
+# per-channel (lower, upper) intervals of the coarse grid, percent
+COARSE_INTERVALS = ((0, 40), (20, 60), (40, 80), (60, 100), (0, 60), (40, 100), (0, 100))
+REFINE_STEPS = (8, 4, 2)
+
+
+#------------------------ FRAMES -------------------------
+
+def sample_frames(source, count=24, settings=VIDEO_SETTINGS, roi=(0, 0, 800, 600)):
+    # evenly spaced crops from a recording or frame cache
+    cap = open_video(source)
+    if cap.isOpened() == False:
+        raise IOError("Error opening video file {}".format(source))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    crop = settings['crop'] and not is_frame_cache(source)
+    frames = []
+    for index in np.linspace(0, max(total-1, 0), count).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = cap.read()
+        if ret:
+            frames.append(np.array(crop_roi(frame, roi) if crop else frame))
+    cap.release()
+    return frames
+
+
+class FrameStack:
+    '''Blurred, downscaled sample frames stacked vertically, separated by blank rows.'''
+
+    def __init__(self, frames, origin, scale=4, gap=4):
+        small = [cv2.resize(cv2.blur(f, (5, 5)), (f.shape[1]//scale, f.shape[0]//scale),
+                            interpolation=cv2.INTER_AREA) for f in frames]
+        self.count = len(small)
+        self.height = small[0].shape[0]+gap
+        self.width = small[0].shape[1]
+        self.image = np.zeros((self.height*self.count, self.width, 3), np.uint8)
+        self.gap_rows = np.zeros(self.height*self.count, bool)
+        for i, f in enumerate(small):
+            self.image[i*self.height:i*self.height+f.shape[0]] = f
+            self.gap_rows[i*self.height+f.shape[0]:(i+1)*self.height] = True
+        self.origin = (origin[0]/scale, origin[1]/scale)
+        self.min_area = max(30//(scale*scale), 2)
+        self.max_area = self.width*(self.height-gap)//20
+        self.kernel = np.ones((3, 3), np.uint8)
+
+
+#------------------------ SCORING -------------------------
+
+def score_bounds(stack, lower, upper):
+    # 0..1: share of frames with exactly one marker blob, discounted by the
+    # spread of its radius around the origin and of its area
+    lowerB, upperB = threshold_bounds(lower, upper)
+    mask = cv2.inRange(stack.image, lowerB, upperB)
+    mask[stack.gap_rows] = 0
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, stack.kernel)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    blobs = areas >= stack.min_area
+    if not blobs.any():
+        return 0.0
+    areas = areas[blobs]
+    cx = centroids[1:, 0][blobs]
+    cy = centroids[1:, 1][blobs]
+    frame = (cy//stack.height).astype(np.intp)
+    cy = cy-frame*stack.height
+
+    per_frame = np.bincount(frame, minlength=stack.count)
+    single = per_frame == 1
+    if single.sum() < max(stack.count//2, 2):
+        return 0.0
+    chosen = single[frame]
+    area = areas[chosen]
+    if area.max() > stack.max_area:
+        return 0.0
+    radius = np.hypot(cx[chosen]-stack.origin[0], cy[chosen]-stack.origin[1])
+
+    spread_radius = radius.std()/max(radius.mean(), 1e-6)
+    spread_area = area.std()/area.mean()
+    return float(single.mean()*(1-min(spread_radius, 1))*(1-min(spread_area, 1)))
+
+
+_stack = None
+
+
+def _init_worker(stack):
+    global _stack
+    _stack = stack
+
+
+def _score(candidate):
+    return score_bounds(_stack, candidate[0], candidate[1])
+
+
+#------------------------ SEARCH -------------------------
+
+def coarse_candidates():
+    for r, g, b in itertools.product(COARSE_INTERVALS, repeat=3):
+        yield (r[0], g[0], b[0]), (r[1], g[1], b[1])
+
+
+def refine_candidates(lower, upper, step):
+    # every single-bound move of +-step around the current best
+    bounds = list(lower)+list(upper)
+    for i in range(6):
+        for delta in (-step, step):
+            moved = list(bounds)
+            moved[i] = int(min(max(moved[i]+delta, 0), 100))
+            if moved[i] != bounds[i] and all(moved[c] < moved[c+3] for c in range(3)):
+                yield tuple(moved[:3]), tuple(moved[3:])
+
+
+def auto_tune(frames, origin, start=(DEFAULT_LOWER, DEFAULT_UPPER), jobs=None):
+    # best (lower, upper, score) for the sampled frames
+    stack = FrameStack(frames, origin)
+    jobs = jobs or multiprocessing.cpu_count()
+    # the GUI calls this with capture, recorder and Qt threads running, which must not be forked
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context(method),
+                             initializer=_init_worker, initargs=(stack,)) as pool:
+        candidates = [tuple(start)]+list(coarse_candidates())
+        scores = list(pool.map(_score, candidates, chunksize=16))
+        best = int(np.argmax(scores))
+        lower, upper = candidates[best]
+        best_score = scores[best]
+
+        for step in REFINE_STEPS:
+            improved = True
+            while improved:
+                candidates = list(refine_candidates(lower, upper, step))
+                scores = list(pool.map(_score, candidates, chunksize=4))
+                improved = bool(scores) and max(scores) > best_score
+                if improved:
+                    best = int(np.argmax(scores))
+                    lower, upper = candidates[best]
+                    best_score = scores[best]
+    return lower, upper, best_score
+
+
+#------------------------ MAIN -------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search RGB thresholds for the traveler marker.')
+    parser.add_argument('video', help='recorded video file or frame cache directory')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='video')
+    parser.add_argument('--roi', type=int, nargs=4, default=(0, 0, 800, 600), metavar=('X', 'Y', 'W', 'H'))
+    parser.add_argument('--samples', type=int, default=24, help='number of frames to sample')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='worker processes (0 = all cores)')
+    args = parser.parse_args(argv)
+    settings = PRESETS[args.preset]
+
+    frames = sample_frames(args.video, args.samples, settings, tuple(args.roi))
+    if not frames:
+        sys.exit("no frames could be read from {}".format(args.video))
+    lower, upper, score = auto_tune(frames, settings['origin'], jobs=args.jobs)
+    print("--lower {} {} {} --upper {} {} {}   (score {:.3f})".format(*(lower+upper+(score,))))
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
@@ -0,0 +1,222 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Synthetic benchmark. Videos of a coloured marker orbiting a known origin at a known RPM are    *
+* rendered and encoded, then decoded and run through the tracking pipeline. For every scenario   *
+* the frames/sec of each stage (decode, track, overlay) and the RPM error against the ground     *
+* truth are reported. Runs headless; a non-zero exit status flags an accuracy regression.        *
+*                                                                                                *
+* Usage: python centrifuge_benchmark.py --max-error 1 --json benchmark.json                      *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+from centrifuge_tracker import MarkerTracker, OverlayRenderer
+
+
+# marker colour inside the default thresholds, BGR
+MARKER_COLOUR = (217, 140, 51)
+BACKGROUND = (60, 60, 60)
+START_ANGLE = 0.5   # rad, keeps the marker off the revolution boundary in the first frame
+
+BASELINE = {'rpm': 300, 'fps': 30, 'size': (640, 480), 'noise': 0, 'occlusion': 0, 'blur': 0}
+
+# name -> changes against the baseline; occlusion in degrees of the orbit,
+# blur as the fraction of the frame interval the shutter stays open
+SCENARIOS = {
+    'baseline': {},
+    'slow': {'rpm': 30},
+    'fast': {'rpm': 800},
+    'fast-60fps': {'rpm': 1500, 'fps': 60},
+    'fast-120fps': {'rpm': 3000, 'fps': 120},
+    'low-res': {'size': (320, 240)},
+    'hd': {'size': (1280, 720)},
+    'noise': {'noise': 12},
+    'occlusion': {'occlusion': 60},
+    'blur': {'rpm': 300, 'blur': 0.3},
+}
+
+
+def scenario_params(name):
+    params = dict(BASELINE)
+    params.update(SCENARIOS[name])
+    return params
+
+
+#------------------------ RENDERING -------------------------
+
+def orbit_geometry(size):
+    # origin, orbit radius and marker radius for a frame size
+    width, height = size
+    origin = (width//2, height//2)
+    return origin, int(0.35*min(width, height)), max(int(0.025*width), 4)
+
+
+def render_frames(params, seconds, seed=0):
+    # (frame, true azimuth) for every frame of a constant-speed run
+    width, height = params['size']
+    origin, orbit, marker = orbit_geometry(params['size'])
+    omega = params['rpm']*2*np.pi/60
+    fps = params['fps']
+    steps = 8 if params['blur'] else 1
+    rng = np.random.default_rng(seed)
+
+    background = np.full((height, width, 3), BACKGROUND, np.uint8)
+    # a few static features so the frame is not flat
+    for i in range(6):
+        corner = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.rectangle(background, corner, (corner[0]+width//8, corner[1]+height//10),
+                      tuple(int(c) for c in rng.integers(30, 110, 3)), -1)
+
+    for index in range(int(seconds*fps)):
+        angle = START_ANGLE+omega*index/fps
+        coverage = np.zeros((height, width), np.float32)
+        for step in range(steps):
+            a = angle+omega*params['blur']/fps*step/steps
+            centre = (int(round(origin[0]-orbit*np.sin(a))), int(round(origin[1]-orbit*np.cos(a))))
+            disc = np.zeros((height, width), np.uint8)
+            cv2.circle(disc, centre, marker, 255, -1, cv2.LINE_AA)
+            coverage += disc.astype(np.float32)/(255*steps)
+        coverage = coverage[:, :, None]
+        frame = background*(1-coverage)+np.array(MARKER_COLOUR, np.float32)*coverage
+
+        if params['occlusion']:
+            # a dark shield over a sector of the orbit, starting at the top
+            cv2.ellipse(frame, origin, (orbit+2*marker, orbit+2*marker), 0,
+                        -90-params['occlusion'], -90, (20, 20, 20), -1)
+        if params['noise']:
+            frame = frame+rng.normal(0, params['noise'], frame.shape)
+        yield np.clip(frame, 0, 255).astype(np.uint8), angle % (2*np.pi)
+
+
+def write_video(path, params, seconds):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), params['fps'], params['size'])
+    for frame, _ in render_frames(params, seconds):
+        writer.write(frame)
+    writer.release()
+
+
+#------------------------ BENCHMARK -------------------------
+
+def run_scenario(path, params, warmup=1.0, **options):
+    # decode and track a rendered video, timing each stage; options go to MarkerTracker
+    origin, orbit, marker = orbit_geometry(params['size'])
+    scale = params['size'][0]/800.0
+    tracker = MarkerTracker(origin, gear_ratio=1, min_area=max(int(30*scale*scale), 4),
+                            search_radius=max(int(48*scale), 16), **options)
+    overlay = OverlayRenderer()
+    fps = params['fps']
+
+    cap = cv2.VideoCapture(path)
+    stages = {'decode': 0.0, 'track': 0.0, 'overlay': 0.0}
+    rpm = []
+    revolution_rpm = []
+    lost = 0
+    index = 0
+    while True:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        t1 = time.perf_counter()
+        if ret == False:
+            break
+        timestamp = index/fps
+        result = tracker.process(frame, timestamp)
+        t2 = time.perf_counter()
+        overlay.draw(frame, result['mask'], result, origin, t2-t1)
+        t3 = time.perf_counter()
+        stages['decode'] += t1-t0
+        stages['track'] += t2-t1
+        stages['overlay'] += t3-t2
+
+        lost = lost+result['lost']
+        if timestamp >= warmup:
+            rpm.append(result['rpm'])
+            if result['new_revolution']:
+                revolution_rpm.append(result['revolution_rpm'])
+        index = index+1
+    cap.release()
+
+    truth = params['rpm']
+    rpm = np.array(rpm)
+    report = dict((stage+'_fps', index/elapsed if elapsed else 0.0) for stage, elapsed in stages.items())
+    report['pipeline_fps'] = index/sum(stages.values()) if index else 0.0
+    report['frames'] = index
+    report['lost_percent'] = 100.0*lost/max(index, 1)
+    report['rpm_error_percent'] = float(np.median(np.abs(rpm-truth))/truth*100) if len(rpm) else float('nan')
+    report['revolution_error_percent'] = (float(np.mean(np.abs(np.array(revolution_rpm)-truth))/truth*100)
+                                          if revolution_rpm else float('nan'))
+    report['revolutions'] = tracker.rotations
+    turns = (START_ANGLE+truth*2*np.pi/60*(index-1)/fps)/(2*np.pi)
+    report['expected_revolutions'] = int(turns)
+    return report
+
+
+def run_benchmark(names, seconds=4.0, directory=None, **options):
+    reports = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in names:
+            params = scenario_params(name)
+            path = os.path.join(directory or scratch, 'synthetic_{}.avi'.format(name))
+            write_video(path, params, seconds)
+            report = run_scenario(path, params, **options)
+            report.update(params)
+            reports[name] = report
+    return reports
+
+
+#------------------------ MAIN -------------------------
+
+def print_reports(reports):
+    header = "{:<12} {:>6} {:>4} {:>9} {:>8} {:>8} {:>8} {:>9} {:>7} {:>8} {:>8} {:>9}"
+    print(header.format('scenario', 'rpm', 'fps', 'size', 'decode', 'track', 'overlay', 'pipeline',
+                        'lost %', 'rpm err%', 'rev err%', 'revs'))
+    row = "{:<12} {:>6} {:>4} {:>9} {:>8.0f} {:>8.0f} {:>8.0f} {:>9.0f} {:>7.1f} {:>8.2f} {:>8.2f} {:>4}/{:<4}"
+    for name, r in reports.items():
+        print(row.format(name, r['rpm'], r['fps'], '{}x{}'.format(*r['size']), r['decode_fps'], r['track_fps'],
+                         r['overlay_fps'], r['pipeline_fps'], r['lost_percent'], r['rpm_error_percent'],
+                         r['revolution_error_percent'], r['revolutions'], r['expected_revolutions']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the tracker on synthetic rotating-marker videos.')
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default all)')
+    parser.add_argument('--seconds', type=float, default=4.0, help='length of every rendered video')
+    parser.add_argument('--keep', metavar='DIR', help='keep the rendered videos in DIR')
+    parser.add_argument('--json', metavar='PATH', help='write the reports as JSON')
+    parser.add_argument('--polar', action='store_true', help='track with the polar ring detector')
+    parser.add_argument('--max-error', type=float, metavar='PERCENT',
+                        help='exit with status 1 if any median RPM error exceeds PERCENT')
+    args = parser.parse_args(argv)
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+    reports = run_benchmark(args.scenario or list(SCENARIOS), args.seconds, args.keep, polar=args.polar)
+    print_reports(reports)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+    if args.max_error is not None:
+        failed = [name for name, r in reports.items() if not r['rpm_error_percent'] <= args.max_error]
+        if failed:
+            sys.exit("RPM error above {}% in: {}".format(args.max_error, ', '.join(failed)))
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
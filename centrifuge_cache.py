@@ -0,0 +1,117 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Content-addressed cache of per-frame marker tracks. Entries are keyed by the hash of the video *
+* file and the segmentation parameters, so RPM/RCF can be recomputed for a new gear ratio or     *
+* tube length without decoding the video again. The cache is bounded in size (LRU on disk).      *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import os
+import json
+import hashlib
+import numpy as np
+
+from centrifuge_video import FRAME_CACHE_META, is_frame_cache
+
+
+# bump when the tracking pipeline changes in a way that alters the stored tracks
+TRACK_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'most_centrifuge')
+
+
+#------------------------ HASHING -------------------------
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_digest(params):
+    # stable hash of a JSON-serializable parameter dict (tuples and lists hash alike)
+    text = json.dumps(params, sort_keys=True, default=list)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+
+#------------------------ CACHE -------------------------
+
+class AnalysisCache:
+    '''Directory of .npy tracks with least-recently-used eviction above max_bytes.'''
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=512 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._digests_path = os.path.join(directory, 'digests.json')
+
+    #------------------------ KEYS -------------------------
+    def video_digest(self, path):
+        # content hash, remembered per (path, size, mtime) so an unchanged file is hashed once.
+        # A frame cache directory is identified by its metadata (source hash, ROI, frame count).
+        if is_frame_cache(path):
+            with open(os.path.join(path, FRAME_CACHE_META)) as f:
+                return params_digest(json.load(f))
+        stat = os.stat(path)
+        ident = '{}|{}|{}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digests = {}
+        if os.path.exists(self._digests_path):
+            with open(self._digests_path) as f:
+                digests = json.load(f)
+        if ident not in digests:
+            digests[ident] = file_digest(path)
+            with open(self._digests_path, 'w') as f:
+                json.dump(digests, f)
+        return digests[ident]
+
+    def key(self, video_path, params):
+        params = dict(params, track_version=TRACK_VERSION)
+        return '{}-{}'.format(self.video_digest(video_path), params_digest(params))
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key+'.npy')
+
+    #------------------------ ENTRIES -------------------------
+    def get(self, key):
+        path = self.entry_path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # mark as recently used
+        return np.load(path)
+
+    def put(self, key, track):
+        path = self.entry_path(key)
+        tmp = path+'.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, track)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        # (mtime, size, path) of every cached track, oldest first
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                result.append((stat.st_mtime, stat.st_size, path))
+        return sorted(result)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total = total-size
+
+#------------------------ END -------------------------
@@ -0,0 +1,162 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Camera mode negotiation. The pixel formats, resolutions and frame rates of a device are read   *
+* from v4l2-ctl where available, or probed through OpenCV otherwise. The mode with the highest   *
+* frame rate whose resolution still covers the ROI is chosen, and the frame rate the device      *
+* really delivers is measured.                                                                   *
+*                                                                                                *
+* Usage: python centrifuge_camera.py 0 --roi 100 100 300 300                                     *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import re
+import time
+import shutil
+import argparse
+import subprocess
+from collections import namedtuple
+import cv2
+
+
+CameraMode = namedtuple('CameraMode', ('fourcc', 'width', 'height', 'fps'))
+
+# the ROI text boxes are in coordinates of the default 800x600 camera frame
+DEFAULT_FRAME_SIZE = (800, 600)
+
+PROBE_FOURCCS = ('MJPG', 'YUYV')
+PROBE_SIZES = ((320, 240), (640, 480), (800, 600), (1024, 768), (1280, 720), (1920, 1080))
+PROBE_FPS = 120     # requested while probing, the driver clamps it to the fastest rate it has
+
+
+#------------------------ LISTING -------------------------
+
+def parse_v4l2_formats(text):
+    # modes from the output of v4l2-ctl --list-formats-ext
+    modes = []
+    fourcc = size = None
+    for line in text.splitlines():
+        match = re.search(r"\[\d+\]: '(\w+)'", line)
+        if match:
+            fourcc = match.group(1)
+            continue
+        match = re.search(r"Size: Discrete (\d+)x(\d+)", line)
+        if match:
+            size = int(match.group(1)), int(match.group(2))
+            continue
+        match = re.search(r"\(([\d.]+) fps\)", line)
+        if match and fourcc and size:
+            modes.append(CameraMode(fourcc, size[0], size[1], float(match.group(1))))
+    return modes
+
+
+def fourcc_string(code):
+    code = int(code)
+    return ''.join(chr((code >> 8*i) & 0xFF) for i in range(4))
+
+
+def apply_mode(cap, mode):
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*mode.fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, mode.width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, mode.height)
+    cap.set(cv2.CAP_PROP_FPS, mode.fps)
+
+
+def probe_modes(device):
+    # modes the driver accepts, found by requesting them and reading the settings back
+    cap = cv2.VideoCapture(device)
+    if cap.isOpened() == False:
+        return []
+    modes = set()
+    for fourcc in PROBE_FOURCCS:
+        for width, height in PROBE_SIZES:
+            apply_mode(cap, CameraMode(fourcc, width, height, PROBE_FPS))
+            got = CameraMode(fourcc_string(cap.get(cv2.CAP_PROP_FOURCC)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                             int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), cap.get(cv2.CAP_PROP_FPS))
+            if got.fourcc == fourcc and (got.width, got.height) == (width, height) and got.fps > 0:
+                modes.add(got)
+    cap.release()
+    return sorted(modes)
+
+
+def list_modes(device):
+    # every (fourcc, width, height, fps) the device offers
+    if shutil.which('v4l2-ctl'):
+        try:
+            text = subprocess.run(['v4l2-ctl', '-d', '/dev/video{}'.format(device), '--list-formats-ext'],
+                                  capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.SubprocessError):
+            text = ''
+        modes = parse_v4l2_formats(text)
+        if modes:
+            return modes
+    return probe_modes(device)
+
+
+#------------------------ SELECTION -------------------------
+
+def roi_frame_size(roi, frame_size=DEFAULT_FRAME_SIZE):
+    # (width, height) a frame needs for the ROI; crop_roi slices rows by x and columns by y
+    x, y, w, h = roi
+    return min(y+h, frame_size[0]), min(x+w, frame_size[1])
+
+
+def choose_mode(modes, size):
+    # highest frame rate covering size; ties go to the smaller resolution, then to
+    # uncompressed YUYV, which needs no JPEG decoding
+    covering = [m for m in modes if m.width >= size[0] and m.height >= size[1]]
+    if not covering:
+        return None
+    return max(covering, key=lambda m: (m.fps, -m.width*m.height, m.fourcc == 'YUYV'))
+
+
+def describe_mode(mode):
+    return "{} {}x{} @ {:g} fps".format(*mode)
+
+
+def measure_fps(cap, seconds=1.0, warmup=5):
+    # frames per second the device really delivers
+    for i in range(warmup):
+        cap.read()
+    times = []
+    start = time.time()
+    while time.time()-start < seconds:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        times.append(time.time())
+    if len(times) < 2 or times[-1] <= times[0]:
+        return 0.0
+    return (len(times)-1)/(times[-1]-times[0])
+
+
+#------------------------ MAIN -------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='List camera modes, pick the fastest one covering the ROI and measure it.')
+    parser.add_argument('device', type=int, nargs='?', default=0)
+    parser.add_argument('--roi', type=int, nargs=4, default=(0, 0, 800, 600), metavar=('X', 'Y', 'W', 'H'))
+    args = parser.parse_args(argv)
+
+    modes = list_modes(args.device)
+    for mode in modes:
+        print(describe_mode(mode))
+    mode = choose_mode(modes, roi_frame_size(args.roi))
+    if mode is None:
+        print("no mode covers the ROI")
+        return
+    cap = cv2.VideoCapture(args.device)
+    apply_mode(cap, mode)
+    print("chosen: {}, measured {:.1f} fps".format(describe_mode(mode), measure_fps(cap)))
+    cap.release()
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
@@ -0,0 +1,238 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Capture/tracking worker. Frames are read and processed on a QThread and the per-frame results  *
+* are handed to the GUI through signals, so the Qt event loop never waits on frame processing.   *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import sys
+import time
+import threading
+import traceback
+from time import perf_counter
+from collections import deque
+import cv2
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from centrifuge_autotune import auto_tune
+from centrifuge_camera import apply_mode, list_modes
+from centrifuge_tracker import OverlayRenderer, crop_roi
+from centrifuge_history import TelemetryLog
+from centrifuge_video import LatestFrameCapture, VideoRecorder, frame_timestamp, is_frame_cache, open_video
+
+
+#------------------------ WORKER -------------------------
+
+class TrackingWorker(QThread):
+    '''Reads frames from a camera index or a video file and tracks the marker.'''
+
+    frame_processed = pyqtSignal(dict)   # centroid, azimuth, rpm, rcf, timestamps
+    frame_ready = pyqtSignal(object)     # annotated frame for display
+    rotor_processed = pyqtSignal(int, dict) # index and result of every additional rotor
+    stream_finished = pyqtSignal()
+
+    def __init__(self, source, tracker, settings, roi=(0, 0, 800, 600), frame_size=(800, 600),
+                 telemetry_path=None, record_path=None, camera_mode=None, rotors=(), parent=None):
+        super().__init__(parent)
+        self.rotors = list(rotors)      # additional Rotors tracked on the same decoded frames
+        self.camera_mode = camera_mode  # CameraMode replacing frame_size for cameras
+        self.capture = None
+        self.telemetry_path = telemetry_path
+        self.record_path = record_path
+        self.recorder = None
+        self.overlay = OverlayRenderer()
+        self.source = source
+        self.tracker = tracker
+        self.settings = settings
+        self.roi = roi
+        self.frame_size = frame_size
+        self.timer = tracker.timer      # stage timings of the loop, read by the GUI panel
+        self.tracing = False
+        self.last_crop = None   # raw crop of the latest frame, for colour sampling
+        self.recent_crops = deque(maxlen=24)    # every sample_every-th crop, for auto-tuning
+        self.sample_every = 5
+
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._display_pending = threading.Event()
+
+    #------------------------ CONTROLS -------------------------
+    def stop(self):
+        self._stop_event.set()
+        self._resume_event.set()
+
+    def pause(self):
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def is_paused(self):
+        return not self._resume_event.is_set()
+
+    def frame_displayed(self):
+        # called by the GUI once it has shown the last frame_ready image
+        self._display_pending.clear()
+
+    #------------------------ CAPTURE LOOP -------------------------
+    def open_capture(self):
+        cap = open_video(self.source)
+        if isinstance(self.source, int) and self.camera_mode is not None:
+            apply_mode(cap, self.camera_mode)
+        else:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_size[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_size[1])
+        if isinstance(self.source, int):
+            # cameras: always process the newest frame, never a stale one from the driver queue
+            cap = LatestFrameCapture(cap)
+        return cap
+
+    def measured_fps(self):
+        # frame rate the camera really delivers, None for recordings
+        capture = self.capture
+        if isinstance(capture, LatestFrameCapture):
+            return capture.fps()
+        return None
+
+    def run(self):
+        cap = None
+        telemetry = None
+        try:
+            cap = self.open_capture()
+            self.capture = cap
+
+            # check if camera opened successfully
+            if cap.isOpened() == False:
+                print("Error opening video stream or file")
+
+            telemetry = TelemetryLog(self.telemetry_path) if self.telemetry_path else None
+            self.recorder = VideoRecorder(self.record_path) if self.record_path else None
+            self.track(cap, telemetry)
+        except Exception:
+            # an exception leaving run() would abort the application
+            print("Tracking stopped by an error:", file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            # release the device and flush the logs however the loop ended
+            if cap is not None:
+                cap.release()
+            if telemetry is not None:
+                telemetry.close()
+            if self.recorder is not None:
+                self.recorder.close()
+                print("Recorded {} frames at {:.1f} fps to {}, dropped {}".format(
+                    self.recorder.written, self.recorder.fps or 0, self.record_path, self.recorder.dropped))
+            self.stream_finished.emit()
+
+    def track(self, cap, telemetry):
+        # recordings are timed by the container, cameras by the grab time
+        recorded = not isinstance(self.source, int)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        crop_enabled = self.settings['crop'] and not is_frame_cache(self.source)
+
+        start_timer = time.time()
+        index = 0
+        while cap.isOpened() and not self._stop_event.is_set():
+            if not self._resume_event.is_set():
+                self._resume_event.wait()
+                if not recorded:
+                    cap.discard()
+                continue
+
+            frame_start = start = perf_counter()
+            ret, frame = cap.read()
+            if ret == False:
+                break
+            timestamp = frame_timestamp(cap, index, fps) if recorded else cap.timestamp
+            self.timer.lap('read', start)
+
+            crop = crop_roi(frame, self.roi) if crop_enabled else frame
+            self.last_crop = crop
+            if index % self.sample_every == 0:
+                self.recent_crops.append(crop)
+
+            result = None
+            if self.tracing:
+                start_timer = time.time()
+                result = self.tracker.process(crop, timestamp)
+                mask = result.pop('mask')
+                result['frame_index'] = index
+                result['processed_time'] = time.time()
+                if not recorded:
+                    # capture-to-result latency and frames skipped to stay current
+                    result['latency'] = result['processed_time']-timestamp
+                    result['dropped_frames'] = cap.dropped
+                    self.timer.record('latency', result['latency'])
+                start = perf_counter()
+                if telemetry is not None:
+                    telemetry.append_result(result)
+                    start = self.timer.lap('telemetry', start)
+                self.frame_processed.emit(result)
+                start = self.timer.lap('emit', start)
+
+                for i, rotor in enumerate(self.rotors):
+                    rotor_result = rotor.process(frame, timestamp)
+                    del rotor_result['mask']
+                    self.rotor_processed.emit(i, rotor_result)
+                if self.rotors:
+                    self.timer.lap('rotors', start)
+            else:
+                # full-frame mask while the thresholds are being tuned
+                mask = self.tracker.segment(crop)
+
+            # skip the display when the GUI has not caught up with the previous frame
+            display = not self._display_pending.is_set()
+            if display or self.recorder is not None:
+                start = perf_counter()
+                output = self.overlay.draw(crop, mask, result, self.tracker.origin,
+                                           time.time()-start_timer, self.tracing)
+                start = self.timer.lap('overlay', start)
+                if self.recorder is not None:
+                    self.recorder.write(output, timestamp)
+                    start = self.timer.lap('record', start)
+                if display:
+                    self._display_pending.set()
+                    self.frame_ready.emit(output)
+            self.timer.lap('frame', frame_start)
+            index = index+1
+
+#------------------------ AUTO-TUNE -------------------------
+
+class AutoTuneWorker(QThread):
+    '''Runs the threshold search off the GUI thread.'''
+
+    tuning_finished = pyqtSignal(object)    # (lower, upper, score)
+
+    def __init__(self, frames, origin, start, parent=None):
+        super().__init__(parent)
+        self.frames = frames
+        self.origin = origin
+        self.start_bounds = start
+
+    def run(self):
+        self.tuning_finished.emit(auto_tune(self.frames, self.origin, self.start_bounds))
+
+
+#------------------------ CAMERA MODES -------------------------
+
+class ModeProbeWorker(QThread):
+    '''Lists the modes of a camera off the GUI thread, probing the driver can take seconds.'''
+
+    modes_listed = pyqtSignal(int, object)    # (device, modes)
+
+    def __init__(self, device, parent=None):
+        super().__init__(parent)
+        self.device = device
+
+    def run(self):
+        self.modes_listed.emit(self.device, list_modes(self.device))
+
+#------------------------ END -------------------------
@@ -0,0 +1,527 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Estimators that turn the per-frame marker position into angular velocity and revolutions.      *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import math
+from collections import deque
+import numpy as np
+
+
+TWO_PI = 2*np.pi
+
+
+#------------------------ FUNCTIONS -------------------------
+
+def marker_angle(cxb, cyb, cxo, cyo):
+    # azimuth in [0, 2pi), counter-clockwise from the upward direction (image y grows downwards)
+    return math.atan2(cxo-cxb, cyo-cyb) % TWO_PI
+
+
+def wrap_angle(angle):
+    # wrap to [-pi, pi)
+    return (angle+np.pi) % TWO_PI - np.pi
+
+
+#------------------------ ANGULAR VELOCITY -------------------------
+
+class AngularVelocityEstimator:
+    '''Continuously unwrapped phase with a sliding-window least-squares angular velocity.
+
+    Every accepted sample updates the velocity estimate. Revolutions are counted when
+    the unwrapped phase passes a multiple of 2pi; the crossing time is interpolated
+    between the two frames around it.
+    '''
+
+    def __init__(self, window=0.5, min_samples=3):
+        self.window = window            # seconds of history used by the fit
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.times = deque()
+        self.phases = deque()
+        self.phase = None               # unwrapped phase, rad
+        self.last_time = None
+        self.omega = 0.0                # rad/s, positive counter-clockwise
+        self.omega_sigma = 0.0          # standard error of omega, rad/s
+        self.k_max = None               # highest / lowest revolution index reached,
+        self.k_min = None               # so jitter around a crossing is counted once
+        self.revolutions = 0
+        self.crossing_time = None
+        self.revolution_period = None
+
+    def predict(self, timestamp):
+        if self.phase is None:
+            return None
+        return self.phase+self.omega*(timestamp-self.last_time)
+
+    def fit(self):
+        n = len(self.times)
+        if n < self.min_samples:
+            return self.omega
+        t = np.fromiter(self.times, np.float64, n)
+        p = np.fromiter(self.phases, np.float64, n)
+        t = t-t.mean()
+        p = p-p.mean()
+        denom = np.dot(t, t)
+        if denom <= 0:
+            return self.omega
+        omega = float(np.dot(t, p)/denom)
+        if n > 2:
+            residual = p-omega*t
+            self.omega_sigma = math.sqrt(np.dot(residual, residual)/(n-2)/denom)
+        return omega
+
+    def update(self, angle, timestamp, quality=1.0):
+        # feed one measured azimuth; returns the interpolated crossing time of a new revolution or None
+        if self.phase is None:
+            self.phase = angle
+            self.last_time = timestamp
+            self.times.append(timestamp)
+            self.phases.append(angle)
+            self.k_max = self.k_min = math.floor(angle/TWO_PI)
+            return None
+        if timestamp <= self.last_time:
+            return None
+
+        # unwrap against the predicted phase so short dropouts do not lose turns
+        predicted = self.predict(timestamp)
+        phase = predicted+wrap_angle(angle-predicted)
+        prev_phase, prev_time = self.phase, self.last_time
+        self.phase, self.last_time = phase, timestamp
+
+        self.times.append(timestamp)
+        self.phases.append(phase)
+        while len(self.times) > self.min_samples and timestamp-self.times[0] > self.window:
+            self.times.popleft()
+            self.phases.popleft()
+        self.omega = self.fit()
+        return self.count_crossing(prev_phase, prev_time, phase, timestamp)
+
+    def count_crossing(self, prev_phase, prev_time, phase, timestamp):
+        # revolution crossings between two consecutive phase samples
+        k = math.floor(phase/TWO_PI)
+        crossing = None
+        if k > self.k_max:
+            self.k_max = k
+            crossing = k*TWO_PI
+        elif k < self.k_min:
+            self.k_min = k
+            crossing = (k+1)*TWO_PI
+        if crossing is None:
+            return None
+
+        fraction = (crossing-prev_phase)/(phase-prev_phase)
+        crossing_time = prev_time+fraction*(timestamp-prev_time)
+        if self.crossing_time is not None and crossing_time > self.crossing_time:
+            self.revolution_period = crossing_time-self.crossing_time
+        self.crossing_time = crossing_time
+        self.revolutions = self.revolutions+1
+        return crossing_time
+
+    def coast(self, timestamp):
+        # frame without a marker; the window fit simply waits for the next measurement
+        return None
+
+    def rpm(self):
+        # instantaneous revolutions per minute of the tracked part
+        return abs(self.omega)*60/TWO_PI
+
+    def rpm_sigma(self):
+        # standard deviation of rpm()
+        return self.omega_sigma*60/TWO_PI
+
+
+class KalmanAngleEstimator(AngularVelocityEstimator):
+    '''Kalman filter on (phase, angular velocity, angular acceleration).
+
+    Constant-acceleration model driven by white jerk noise. Measured azimuths are
+    weighted by a quality in (0, 1] (a partly hidden blob is a less precise
+    measurement); frames without a marker only run the prediction, so the phase
+    coasts through short occlusions and revolutions are still counted. After
+    max_coast seconds without a marker the filter stops and restarts from the next
+    measurement. Every RPM value comes with the standard deviation of the velocity state.
+    '''
+
+    def __init__(self, jerk_noise=50.0, angle_noise=0.005, initial_velocity=30.0, gate=5.0, max_coast=0.5):
+        self.jerk_noise = jerk_noise            # spectral density of the jerk, rad^2/s^5
+        self.angle_noise = angle_noise          # azimuth std of a full-quality blob, rad
+        self.initial_velocity = initial_velocity  # prior std of the velocity, rad/s
+        self.gate = gate                        # innovations beyond this many sigmas are ignored
+        self.max_coast = max_coast              # longest dropout bridged by the prediction, s
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.state = None                       # [phase, omega, alpha]
+        self.covariance = None
+        self.updates = 0
+        self.rejected = 0
+        self.measured_time = None               # time of the last accepted measurement
+
+    def predict(self, timestamp):
+        if self.state is None:
+            return None
+        dt = timestamp-self.last_time
+        return self.state[0]+self.state[1]*dt+0.5*self.state[2]*dt*dt
+
+    def propagate(self, timestamp):
+        # time update of state and covariance to timestamp
+        dt = timestamp-self.last_time
+        F = np.array(((1.0, dt, 0.5*dt*dt), (0.0, 1.0, dt), (0.0, 0.0, 1.0)))
+        q = self.jerk_noise
+        Q = q*np.array(((dt**5/20, dt**4/8, dt**3/6), (dt**4/8, dt**3/3, dt**2/2), (dt**3/6, dt**2/2, dt)))
+        self.state = F.dot(self.state)
+        self.covariance = F.dot(self.covariance).dot(F.T)+Q
+
+    def update(self, angle, timestamp, quality=1.0):
+        # feed one measured azimuth; returns the interpolated crossing time of a new revolution or None
+        if self.state is None:
+            self.state = np.array((angle, 0.0, 0.0))
+            self.covariance = np.diag((self.angle_noise**2, self.initial_velocity**2, self.initial_velocity**2))
+            self.phase, self.last_time = angle, timestamp
+            self.measured_time = timestamp
+            self.k_max = self.k_min = math.floor(angle/TWO_PI)
+            return None
+        if timestamp <= self.last_time:
+            return None
+
+        prev_phase, prev_time = self.phase, self.last_time
+        self.propagate(timestamp)
+        innovation = wrap_angle(angle-self.state[0])
+        noise = (self.angle_noise/max(quality, 0.05))**2
+        S = self.covariance[0, 0]+noise
+        # a measurement far outside the predicted spread is a wrong blob, unless it keeps happening
+        if self.updates > 5 and innovation*innovation > self.gate*self.gate*S and self.rejected < 3:
+            self.rejected = self.rejected+1
+        else:
+            self.rejected = 0
+            K = self.covariance[:, 0]/S
+            self.state = self.state+K*innovation
+            self.covariance = self.covariance-np.outer(K, self.covariance[0, :])
+            self.updates = self.updates+1
+            self.measured_time = timestamp
+        return self.advance(prev_phase, prev_time, timestamp)
+
+    def coast(self, timestamp):
+        # frame without a marker: predict only; revolutions are still counted
+        if self.state is None or timestamp <= self.last_time:
+            return None
+        if timestamp-self.measured_time > self.max_coast:
+            self.expire()
+            return None
+        prev_phase, prev_time = self.phase, self.last_time
+        self.propagate(timestamp)
+        return self.advance(prev_phase, prev_time, timestamp)
+
+    def expire(self):
+        # the marker has been gone too long to predict: drop the state but keep the
+        # revolution count; the next measurement starts a new track
+        self.state = None
+        self.covariance = None
+        self.phase = None
+        self.omega = 0.0
+        self.crossing_time = None
+        self.updates = 0
+        self.rejected = 0
+
+    def advance(self, prev_phase, prev_time, timestamp):
+        self.phase, self.last_time = float(self.state[0]), timestamp
+        self.omega = float(self.state[1])
+        return self.count_crossing(prev_phase, prev_time, self.phase, timestamp)
+
+    def rpm_sigma(self):
+        # standard deviation of rpm()
+        if self.covariance is None:
+            return 0.0
+        return math.sqrt(max(self.covariance[1, 1], 0.0))*60/TWO_PI
+
+
+#------------------------ ALIASED ROTATION -------------------------
+
+class AliasResolvingEstimator:
+    '''Rotation frequency above the frame-rate Nyquist limit from probes on the orbit.
+
+    Every frame gives the marker presence at K probe points at angles theta_k, each
+    sampled at its own time t (a rolling shutter reads the probe rows one after the
+    other). For the true frequency f the phases theta_k - 2pi f t of all lit probes
+    agree, so the coherence |sum p exp(i(theta - 2pi f t))| / sum p over a sliding
+    window peaks there. The sums for a grid of candidate frequencies are kept as a
+    sliding DFT: each frame adds its lit probes and drops the oldest frame.
+
+    With a global shutter all probes of a frame share one time and the peaks repeat
+    every fs (the aliases); then the alias nearest the expected frequency is taken,
+    or the current one is kept.
+    '''
+
+    def __init__(self, angles, window=64, max_rpm=3000.0, resolution=0.1, margin=0.05, min_presence=0.5):
+        self.angles = np.asarray(angles, np.float64)
+        self.window = window                # frames in the sliding window
+        max_frequency = max_rpm/60.0
+        self.grid = np.arange(-max_frequency, max_frequency+resolution, resolution)  # rev/s
+        self.resolution = resolution
+        self.margin = margin                # relative coherence lead that resolves an alias
+        self.min_presence = min_presence    # summed presence below this = marker not seen
+        self.reset()
+
+    def reset(self):
+        self.terms = np.zeros((self.window, len(self.grid)), np.complex128)
+        self.weights = np.zeros(self.window)
+        self.sums = np.zeros(len(self.grid), np.complex128)
+        self.count = 0
+        self.start_time = None
+        self.period = None                  # running mean frame interval, s
+        self.frequency = 0.0                # signed, rev/s, positive counter-clockwise
+        self.alias = 0                      # n in f = f_a + n*fs
+        self.resolved = False               # alias chosen by coherence rather than by the prior
+        self.coherence = 0.0
+        self.azimuth = None
+        self.turns = 0.0
+        self.last_time = None
+
+    def update(self, presence, timestamp, offsets=None, expected_frequency=None):
+        # presence: K values in [0, 1]; offsets: sampling time of every probe relative to timestamp
+        if self.start_time is None:
+            self.start_time = timestamp
+        if self.last_time is not None and timestamp > self.last_time:
+            dt = timestamp-self.last_time
+            self.period = dt if self.period is None else 0.95*self.period+0.05*dt
+
+        # slide the DFT: drop the oldest frame, add the lit probes of this one
+        slot = self.count % self.window
+        self.sums = self.sums-self.terms[slot]
+        lit = np.flatnonzero(presence)
+        if len(lit) and np.sum(presence) >= self.min_presence:
+            t = np.full(len(lit), timestamp-self.start_time)
+            if offsets is not None:
+                t = t+np.asarray(offsets)[lit]
+            phases = self.angles[lit][None, :]-TWO_PI*self.grid[:, None]*t[None, :]
+            self.terms[slot] = np.exp(1j*phases).dot(presence[lit])
+            self.weights[slot] = presence[lit].sum()
+            self.azimuth = float(np.angle(np.dot(presence[lit], np.exp(1j*self.angles[lit])))) % TWO_PI
+        else:
+            self.terms[slot] = 0
+            self.weights[slot] = 0.0
+        self.sums = self.sums+self.terms[slot]
+        self.count = self.count+1
+        if self.count % self.window == 0:
+            self.sums = self.terms.sum(axis=0)      # no drift from the running updates
+
+        if self.count >= 4 and self.period:
+            self.estimate(expected_frequency)
+        if self.last_time is not None:
+            self.turns = self.turns+self.frequency*(timestamp-self.last_time)
+        self.last_time = timestamp
+        return self.frequency
+
+    def estimate(self, expected_frequency):
+        total = self.weights.sum()
+        if total <= 0:
+            return
+        coherence = np.abs(self.sums)/total
+        best = int(np.argmax(coherence))
+
+        # the same peak one or more frame rates away is an alias
+        fs = 1.0/self.period
+        step = fs/self.resolution
+        n = np.arange(-int(len(self.grid)/step)-1, int(len(self.grid)/step)+2)
+        centres = np.rint(best+n*step).astype(int)
+        keep = (centres >= 0) & (centres < len(self.grid))
+        n, centres = n[keep], centres[keep]
+        # the alias peaks may sit a bin or two off the grid point
+        peaks = [c-2+int(np.argmax(coherence[max(c-2, 0):c+3])) if c >= 2 else int(np.argmax(coherence[:c+3]))
+                 for c in centres]
+        scores = coherence[peaks]
+        tied = scores >= (1-self.margin)*scores.max()
+        self.resolved = tied.sum() == 1
+        if self.resolved:
+            choice = int(np.argmax(scores))
+        elif expected_frequency is not None:
+            choice = np.flatnonzero(tied)[np.argmin(np.abs(self.grid[np.array(peaks)[tied]]-expected_frequency))]
+        else:
+            # keep following the alias of the current estimate
+            choice = np.flatnonzero(tied)[np.argmin(np.abs(self.grid[np.array(peaks)[tied]]-self.frequency))]
+        peak = peaks[choice]
+
+        # parabolic interpolation between the grid points around the peak
+        frequency = self.grid[peak]
+        if 0 < peak < len(self.grid)-1:
+            a, b, c = coherence[peak-1], coherence[peak], coherence[peak+1]
+            denominator = a-2*b+c
+            if denominator < 0:
+                frequency = frequency+0.5*(a-c)/denominator*self.resolution
+        self.frequency = float(frequency)
+        self.coherence = float(coherence[peak])
+        self.alias = int(math.floor(self.frequency/fs))
+
+    def aliased_frequency(self):
+        # what a plain frame-to-frame tracker would see, in [0, fs)
+        return self.frequency % (1.0/self.period) if self.period else 0.0
+
+    def rpm(self):
+        return abs(self.frequency)*60
+
+    def rotations(self):
+        return int(abs(self.turns))
+
+
+#------------------------ ORIGIN -------------------------
+
+class CircleFit:
+    '''Incremental least-squares circle through the marker centroids.
+
+    The algebraic (Kasa) fit x^2+y^2 = 2ax+2by+c is solved from nine running sums, so
+    every point costs O(1). Old points fade with a forgetting factor, which lets the
+    centre drift with the camera. Points far off the current circle are rejected and
+    fitted by a candidate circle of their own; when most of the recent points are
+    rejected and the candidate covers the orbit, the camera has been bumped and the
+    candidate replaces the fit.
+    '''
+
+    def __init__(self, forgetting=0.998, min_points=20, min_sectors=5, outlier_sigma=4.0,
+                 min_sigma=2.0, window=60, switch_rate=0.5):
+        self.forgetting = forgetting
+        self.min_points = min_points
+        self.min_sectors = min_sectors      # of 8 azimuth sectors the points must cover
+        self.outlier_sigma = outlier_sigma
+        self.min_sigma = min_sigma          # px, floor of the residual spread
+        self.window = window                # points over which the rejection rate is taken
+        self.switch_rate = switch_rate      # rejection rate that lets the candidate take over
+        self.reset()
+
+    def reset(self):
+        self.reference = None           # first point, subtracted for conditioning
+        self.normal = np.zeros((3, 3))  # running sums of [x y 1]^T [x y 1]
+        self.target = np.zeros(3)       # running sums of [x y 1] (x^2+y^2)
+        self.points = 0
+        self.sectors = 0                # bitmask of covered azimuth sectors
+        self.variance = 0.0             # running mean squared residual, px^2
+        self.recent = deque(maxlen=self.window)    # 1 for every recently rejected point
+        self.candidate = None           # circle through the rejected points
+        self.centre = None
+        self.radius = None
+
+    @property
+    def ready(self):
+        return (self.centre is not None and self.points >= self.min_points
+                and bin(self.sectors).count('1') >= self.min_sectors)
+
+    def add(self, x, y):
+        # feed one centroid; returns False if it was rejected as an outlier
+        if self.ready:
+            residual = math.hypot(x-self.centre[0], y-self.centre[1])-self.radius
+            sigma = max(math.sqrt(self.variance), self.min_sigma)
+            rejected = abs(residual) > self.outlier_sigma*sigma
+            self.recent.append(int(rejected))
+            rate = sum(self.recent)/float(self.window)
+            if rejected:
+                if self.candidate is None:
+                    self.candidate = CircleFit(self.forgetting, self.min_points, self.min_sectors,
+                                               self.outlier_sigma, self.min_sigma, self.window, self.switch_rate)
+                self.candidate.add(x, y)
+                if not (rate >= self.switch_rate and self.candidate.ready):
+                    return False
+                # the orbit has moved: continue from the candidate circle
+                candidate = self.candidate
+                self.reference, self.normal, self.target = candidate.reference, candidate.normal, candidate.target
+                self.points, self.sectors, self.variance = candidate.points, candidate.sectors, candidate.variance
+                self.centre, self.radius = candidate.centre, candidate.radius
+                self.recent.clear()
+                self.candidate = None
+                return True
+            self.variance = self.forgetting*self.variance+(1-self.forgetting)*residual*residual
+            if rate == 0:
+                # only sporadic outliers so far, forget them
+                self.candidate = None
+
+        if self.reference is None:
+            self.reference = (x, y)
+        u, v = x-self.reference[0], y-self.reference[1]
+        row = np.array((u, v, 1.0))
+        self.normal *= self.forgetting
+        self.normal += np.outer(row, row)
+        self.target *= self.forgetting
+        self.target += row*(u*u+v*v)
+        self.points = self.points+1
+
+        if self.points >= 3:
+            try:
+                a2, b2, c = np.linalg.solve(self.normal, self.target)
+            except np.linalg.LinAlgError:
+                return True
+            a, b = a2/2, b2/2
+            r2 = c+a*a+b*b
+            if r2 > 0:
+                self.centre = (float(a+self.reference[0]), float(b+self.reference[1]))
+                self.radius = math.sqrt(r2)
+                sector = int(((math.atan2(y-self.centre[1], x-self.centre[0])+np.pi)/TWO_PI*8)) % 8
+                self.sectors |= 1 << sector
+        return True
+
+
+def fit_circle(x, y, iterations=3, outlier_sigma=4.0, min_sigma=2.0):
+    # (cx, cy, radius) of a batch of points, refitted without outliers; None if degenerate
+    keep = np.ones(len(x), bool)
+    fit = None
+    for i in range(iterations):
+        if keep.sum() < 3:
+            break
+        A = np.column_stack((x[keep], y[keep], np.ones(keep.sum())))
+        (a2, b2, c), *rest = np.linalg.lstsq(A, x[keep]**2+y[keep]**2, rcond=None)
+        a, b = a2/2, b2/2
+        r2 = c+a*a+b*b
+        if r2 <= 0:
+            break
+        fit = (float(a), float(b), math.sqrt(r2))
+        residual = np.hypot(x-a, y-b)-fit[2]
+        sigma = max(residual[keep].std(), min_sigma)
+        keep = np.abs(residual) <= outlier_sigma*sigma
+    return fit
+
+
+#------------------------ BATCH -------------------------
+
+def marker_angles(cx, cy, cxo, cyo):
+    # vectorized marker_angle
+    return np.arctan2(cxo-cx, cyo-cy) % TWO_PI
+
+
+def crossing_times(times, angles):
+    # Vectorized revolution crossings of a recorded track, following the same rules as
+    # AngularVelocityEstimator.update (phase unwrapped sample to sample, each new turn
+    # counted once in either direction, crossing time interpolated between frames).
+    if len(times) < 2:
+        return np.zeros(0)
+    phase = np.unwrap(angles)
+    k = np.floor(phase/TWO_PI)
+    k_max = np.maximum.accumulate(k)
+    k_min = np.minimum.accumulate(k)
+    forward = np.flatnonzero(np.diff(k_max) > 0)+1
+    backward = np.flatnonzero(np.diff(k_min) < 0)+1
+    index = np.concatenate((forward, backward))
+    crossing = np.concatenate((k_max[forward], k_min[backward]+1))*TWO_PI
+    order = np.argsort(index, kind='stable')
+    index, crossing = index[order], crossing[order]
+
+    fraction = (crossing-phase[index-1])/(phase[index]-phase[index-1])
+    return times[index-1]+fraction*(times[index]-times[index-1])
+
+
+def window_rpm(times, angles, end_time, window=0.5):
+    # least-squares rpm over the samples in (end_time-window, end_time]
+    selected = (times > end_time-window) & (times <= end_time)
+    if selected.sum() < 3:
+        return 0.0
+    t = times[selected]-times[selected].mean()
+    p = np.unwrap(angles[selected])
+    return abs(np.dot(t, p-p.mean())/np.dot(t, t))*60/TWO_PI
+
+#------------------------ END -------------------------
@@ -0,0 +1,151 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Direct high-speed RPM. Instead of following the slow handle and multiplying by the gear ratio, *
+* a marker on the tube rotor itself is sampled at a ring of probe points every frame. Its speed  *
+* is resolved from the aliased probe signals, far above half the camera frame rate. A rolling    *
+* shutter reads every probe row at a slightly different time, which tells the aliases apart;     *
+* with a global shutter an expected RPM (or a max RPM below the second alias) picks one.         *
+*                                                                                                *
+* Usage: python centrifuge_highspeed.py rotor.avi --origin 320 240 --radius 170 --readout 25     *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import sys
+import argparse
+import cv2
+import numpy as np
+
+from centrifuge_estimators import TWO_PI, AliasResolvingEstimator
+from centrifuge_tracker import DEFAULT_LOWER, DEFAULT_UPPER, compute_rcf, threshold_bounds
+from centrifuge_video import frame_timestamp, open_video
+
+
+#------------------------ PROBES -------------------------
+
+class RingProbes:
+    '''Probe points evenly spaced on the marker orbit.
+
+    Each probe averages a small square patch, so a frame costs a few hundred
+    pixel reads. Angles follow marker_angle: counter-clockwise from up.
+    '''
+
+    def __init__(self, origin, radius, count=64, patch=3, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER, lut=None):
+        self.origin = origin
+        self.radius = radius
+        self.angles = np.arange(count)*TWO_PI/count
+        self.lowerB, self.upperB = threshold_bounds(lower, upper)
+        self.lut = lut          # trained ColourLUT, replaces the thresholds when given
+        x = np.rint(origin[0]-radius*np.sin(self.angles)).astype(int)
+        y = np.rint(origin[1]-radius*np.cos(self.angles)).astype(int)
+        d = np.arange(patch)-patch//2
+        dx, dy = [g.ravel() for g in np.meshgrid(d, d)]
+        self.xs = x[:, None]+dx[None, :]
+        self.ys = y[:, None]+dy[None, :]
+
+    def row_offsets(self, line_time):
+        # sampling time of every probe relative to the first row, s
+        return self.ys.mean(axis=1)*line_time
+
+    def sample(self, frame):
+        # fraction of every probe patch that has the marker colour
+        xs = np.clip(self.xs, 0, frame.shape[1]-1)
+        ys = np.clip(self.ys, 0, frame.shape[0]-1)
+        pixels = frame[ys, xs]
+        if self.lut is not None:
+            inside = self.lut.classify(pixels) > 0
+        else:
+            inside = np.all((pixels >= self.lowerB) & (pixels <= self.upperB), axis=-1)
+        return inside.mean(axis=1)
+
+
+#------------------------ TRACKER -------------------------
+
+class HighSpeedTracker:
+    '''Direct rotor speed from ring probes, with the same result keys as MarkerTracker where they apply.'''
+
+    def __init__(self, origin, radius, probes=64, readout=0.0, frame_height=600, max_rpm=3000.0,
+                 expected_rpm=None, window=64, tube_length=15, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER, lut=None):
+        self.probes = RingProbes(origin, radius, probes, lower=lower, upper=upper, lut=lut)
+        # readout = time the sensor takes from the first to the last row, s (0 = global shutter)
+        self.offsets = self.probes.row_offsets(readout/frame_height) if readout else None
+        self.expected_rpm = expected_rpm
+        self.tube_length = tube_length
+        self.estimator = AliasResolvingEstimator(self.probes.angles, window, max_rpm)
+
+    def reset(self):
+        self.estimator.reset()
+
+    def process(self, frame, timestamp):
+        presence = self.probes.sample(frame)
+        expected = self.expected_rpm/60.0 if self.expected_rpm else None
+        self.estimator.update(presence, timestamp, self.offsets, expected)
+        rpm = self.estimator.rpm()
+        return {
+            'azimuth': self.estimator.azimuth,
+            'lost': self.estimator.azimuth is None or presence.sum() < self.estimator.min_presence,
+            'presence': presence,
+            'rpm': rpm,
+            'aliased_rpm': self.estimator.aliased_frequency()*60,
+            'alias': self.estimator.alias,
+            'resolved': self.estimator.resolved,
+            'coherence': self.estimator.coherence,
+            'rcf': compute_rcf(rpm, self.tube_length),
+            'rotations': self.estimator.rotations(),
+        }
+
+
+#------------------------ MAIN -------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure a fast rotor directly from aliased probe samples.')
+    parser.add_argument('video', help='video file or camera index')
+    parser.add_argument('--origin', type=float, nargs=2, required=True, metavar=('X', 'Y'))
+    parser.add_argument('--radius', type=float, required=True, help='marker orbit radius, px')
+    parser.add_argument('--probes', type=int, default=64, help='probe spacing on the orbit should not exceed the marker size')
+    parser.add_argument('--readout', type=float, default=0.0,
+                        help='rolling-shutter readout time of the whole frame, ms (0 = global shutter)')
+    parser.add_argument('--max-rpm', type=float, default=3000.0)
+    parser.add_argument('--expected-rpm', type=float, help='picks between aliases a global shutter cannot tell apart')
+    parser.add_argument('--tube-length', type=float, default=15)
+    parser.add_argument('--lower', type=int, nargs=3, default=DEFAULT_LOWER, metavar=('R', 'G', 'B'))
+    parser.add_argument('--upper', type=int, nargs=3, default=DEFAULT_UPPER, metavar=('R', 'G', 'B'))
+    parser.add_argument('--interval', type=float, default=1.0, help='print period, s of video')
+    args = parser.parse_args(argv)
+
+    source = int(args.video) if args.video.isdigit() else args.video
+    cap = open_video(source)
+    if cap.isOpened() == False:
+        sys.exit("Error opening video stream or file {}".format(args.video))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 600
+    tracker = HighSpeedTracker(tuple(args.origin), args.radius, args.probes, args.readout/1000.0, height,
+                               args.max_rpm, args.expected_rpm, tube_length=args.tube_length,
+                               lower=tuple(args.lower), upper=tuple(args.upper))
+
+    frame_index = 0
+    shown = None
+    while True:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        timestamp = frame_timestamp(cap, frame_index, fps)
+        result = tracker.process(frame, timestamp)
+        if shown is None or timestamp-shown >= args.interval:
+            print("{:8.2f} s {:9.1f} RPM {:8.2f} RCF  aliased {:7.1f}  n={:+d} {}".format(
+                timestamp, result['rpm'], result['rcf'], result['aliased_rpm'], result['alias'],
+                'resolved' if result['resolved'] else 'prior'), flush=True)
+            shown = timestamp
+        frame_index = frame_index+1
+    cap.release()
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
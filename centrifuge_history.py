@@ -0,0 +1,155 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Session history: every revolution of a run is kept in growable chunked arrays and the chart    *
+* reads a min/max decimated view of it, so drawing cost does not grow with the session length.   *
+* Per-frame telemetry goes to a fixed-width binary log that NumPy can memory-map.                *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import os
+import numpy as np
+
+
+# one packed 37-byte record per processed frame
+TELEMETRY_DTYPE = np.dtype([
+    ('timestamp', '<f8'),       # capture time, s
+    ('frame_index', '<u8'),
+    ('cx', '<f4'),              # marker centroid in crop coordinates, px
+    ('cy', '<f4'),
+    ('area', '<u4'),            # marker blob area, px
+    ('azimuth', '<f4'),         # rad
+    ('lost', 'u1'),
+    ('rpm', '<f4'),             # instantaneous tubes RPM
+])
+
+TELEMETRY_MAGIC = b'MOSTTLM1'
+TELEMETRY_HEADER_SIZE = 64
+
+# merged log of several capture processes: the source index in front of every record
+STATION_DTYPE = np.dtype([('source', 'u1')]+TELEMETRY_DTYPE.descr)
+STATION_MAGIC = b'MOSTSTN1'
+
+
+#------------------------ SESSION HISTORY -------------------------
+
+class SessionHistory:
+    '''Append-only columns of per-revolution values stored in fixed-size chunks.'''
+
+    def __init__(self, columns=('time', 'rpm', 'rcf'), chunk_size=4096):
+        self.columns = tuple(columns)
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def clear(self):
+        self.chunks = []        # full chunks, shape (chunk_size, n_columns)
+        self.current = np.empty((self.chunk_size, len(self.columns)))
+        self.fill = 0
+        self._joined = None
+
+    def __len__(self):
+        return len(self.chunks)*self.chunk_size+self.fill
+
+    def append(self, *values):
+        self.current[self.fill] = values
+        self.fill = self.fill+1
+        if self.fill == self.chunk_size:
+            self.chunks.append(self.current)
+            self.current = np.empty((self.chunk_size, len(self.columns)))
+            self.fill = 0
+        self._joined = None
+
+    def data(self):
+        # all rows as one array; rebuilt lazily after appends
+        if self._joined is None:
+            self._joined = np.concatenate(self.chunks+[self.current[:self.fill]])
+        return self._joined
+
+    def column(self, name):
+        return self.data()[:, self.columns.index(name)]
+
+    def decimated(self, name, buckets):
+        # (x, y) min/max envelope with at most 2*buckets points; x is the row number (1-based)
+        y = self.column(name)
+        n = len(y)
+        x = np.arange(1, n+1, dtype=np.float64)
+        if n <= 2*buckets:
+            return x, y
+        starts = np.linspace(0, n, buckets+1).astype(np.intp)[:-1]
+        xs = np.repeat(x[starts], 2)
+        ys = np.empty(2*buckets)
+        ys[0::2] = np.minimum.reduceat(y, starts)
+        ys[1::2] = np.maximum.reduceat(y, starts)
+        return xs, ys
+
+#------------------------ TELEMETRY LOG -------------------------
+
+class TelemetryLog:
+    '''Append-only per-frame log of TELEMETRY_DTYPE records behind a 64-byte header.
+
+    Records are staged in a preallocated structured buffer and written in blocks,
+    so logging a frame is a single row assignment.
+    '''
+
+    def __init__(self, path, block_size=1024, dtype=TELEMETRY_DTYPE, magic=TELEMETRY_MAGIC):
+        self.path = path
+        self.buffer = np.zeros(block_size, dtype)
+        self.fill = 0
+        self.count = 0
+        self.file = open(path, 'wb')
+        header = magic+np.uint32(dtype.itemsize).tobytes()
+        self.file.write(header.ljust(TELEMETRY_HEADER_SIZE, b'\0'))
+
+    def append(self, *values):
+        # one record, fields in dtype order (timestamp, frame_index, cx, cy, area, azimuth, lost, rpm)
+        self.buffer[self.fill] = values
+        self.fill = self.fill+1
+        if self.fill == len(self.buffer):
+            self.flush()
+
+    def append_result(self, result):
+        centroid = result['centroid'] or (0, 0)
+        self.append(result['timestamp'], result['frame_index'], centroid[0], centroid[1],
+                    result['area'], result['azimuth'], result['lost'], result['rpm'])
+
+    def flush(self):
+        if self.fill:
+            self.buffer[:self.fill].tofile(self.file)
+            self.count = self.count+self.fill
+            self.fill = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_telemetry(path, dtype=TELEMETRY_DTYPE, magic=TELEMETRY_MAGIC):
+    # zero-copy structured view of a telemetry log
+    with open(path, 'rb') as f:
+        header = f.read(TELEMETRY_HEADER_SIZE)
+    if header[:len(magic)] != magic:
+        raise ValueError("{} is not a telemetry log".format(path))
+    if np.frombuffer(header, np.uint32, 1, len(magic))[0] != dtype.itemsize:
+        raise ValueError("{} has an unsupported record size".format(path))
+    if os.path.getsize(path) == TELEMETRY_HEADER_SIZE:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, 'r', offset=TELEMETRY_HEADER_SIZE)
+
+
+def read_station_log(path):
+    return read_telemetry(path, STATION_DTYPE, STATION_MAGIC)
+
+#------------------------ END -------------------------
@@ -0,0 +1,316 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Headless offline analysis of recorded spin tests. Frames are processed as fast as they can be  *
+* decoded and timing is taken from the video container, so results are reproducible.             *
+*                                                                                                *
+* Usage: python centrifuge_offline.py video/v7.avi -o v7_revolutions.csv                         *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import sys
+import csv
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+from centrifuge_cache import AnalysisCache, DEFAULT_CACHE_DIR
+from centrifuge_estimators import crossing_times, fit_circle, marker_angles, window_rpm
+from centrifuge_history import TelemetryLog
+from centrifuge_rotors import load_rotors
+from centrifuge_tracker import (CAM_SETTINGS, VIDEO_SETTINGS, DEFAULT_LOWER, DEFAULT_UPPER,
+                                crop_roi, compute_rcf, make_tracker)
+from centrifuge_video import build_frame_cache, frame_timestamp, is_frame_cache, open_video
+
+
+PRESETS = {'cam': CAM_SETTINGS, 'video': VIDEO_SETTINGS}
+
+# columns of a per-frame marker track
+TRACK_COLUMNS = ('timestamp', 'frame_index', 'cx', 'cy', 'area', 'lost')
+
+# frames tracked before every parallel segment to bring the tracker into the sequential state
+SEGMENT_WARMUP = 30
+
+
+#------------------------ TRACKING -------------------------
+
+def track_video(path, settings=VIDEO_SETTINGS, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER,
+                roi=(0, 0, 800, 600), start_frame=0, stop_frame=None):
+    # per-frame marker track, one row per decoded frame (see TRACK_COLUMNS).
+    # path may also be a frame cache directory, whose frames are already cropped.
+    cap = open_video(path)
+    if cap.isOpened() == False:
+        raise IOError("Error opening video file {}".format(path))
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    crop = settings['crop'] and not is_frame_cache(path)
+    tracker = make_tracker(settings, lower=lower, upper=upper)
+    rows = []
+    index = start_frame
+    # without a stop the video is read to the end, CAP_PROP_FRAME_COUNT is only an estimate for many containers
+    while stop_frame is None or index < stop_frame:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        timestamp = frame_timestamp(cap, index, fps)
+        result = tracker.process(crop_roi(frame, roi) if crop else frame, timestamp)
+        if result['lost']:
+            rows.append((timestamp, index, 0, 0, 0, 1))
+        else:
+            rows.append((timestamp, index, result['centroid'][0], result['centroid'][1], result['area'], 0))
+        index = index+1
+    cap.release()
+
+    return np.array(rows, dtype=np.float64).reshape(-1, len(TRACK_COLUMNS))
+
+
+def track_rotors(path, rotors):
+    # one marker track per rotor from a single decoding pass, keyed by rotor name
+    cap = open_video(path)
+    if cap.isOpened() == False:
+        raise IOError("Error opening video file {}".format(path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    rows = dict((rotor.name, []) for rotor in rotors)
+    index = 0
+    while True:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        timestamp = frame_timestamp(cap, index, fps)
+        for rotor in rotors:
+            result = rotor.process(frame, timestamp)
+            if result['lost']:
+                rows[rotor.name].append((timestamp, index, 0, 0, 0, 1))
+            else:
+                rows[rotor.name].append((timestamp, index, result['centroid'][0], result['centroid'][1],
+                                         result['area'], 0))
+        index = index+1
+    cap.release()
+    return dict((name, np.array(r, dtype=np.float64).reshape(-1, len(TRACK_COLUMNS))) for name, r in rows.items())
+
+
+def video_frame_count(path):
+    cap = open_video(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+
+def split_frames(frame_count, segments):
+    # N contiguous [start, stop) frame ranges covering the whole video; the frame count
+    # may be an estimate, so the last range has no stop and is read to the end
+    bounds = np.linspace(0, frame_count, segments+1).astype(int)
+    ranges = [(int(bounds[i]), int(bounds[i+1])) for i in range(segments) if bounds[i+1] > bounds[i]]
+    if ranges:
+        ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def _track_segment(args):
+    # the tracker runs warmup frames before the segment so that it enters the segment in
+    # the same state as a sequential pass would; those rows are dropped
+    path, settings, lower, upper, roi, start_frame, stop_frame, warmup = args
+    track = track_video(path, settings, lower, upper, roi, max(start_frame-warmup, 0), stop_frame)
+    return track[track[:, 1] >= start_frame]
+
+
+def stitch_tracks(tracks):
+    # join per-segment tracks in time order; rows repeated by an inexact seek at a seam are dropped
+    stitched = []
+    last_time = -np.inf
+    for track in tracks:
+        if len(track) == 0:
+            continue
+        track = track[track[:, 0] > last_time]
+        if len(track):
+            stitched.append(track)
+            last_time = track[-1, 0]
+    if not stitched:
+        return np.zeros((0, len(TRACK_COLUMNS)))
+    return np.concatenate(stitched)
+
+
+def track_video_parallel(path, jobs=None, settings=VIDEO_SETTINGS, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER,
+                         roi=(0, 0, 800, 600), warmup=SEGMENT_WARMUP):
+    # track N time ranges of one video in separate processes and stitch the result
+    jobs = jobs or multiprocessing.cpu_count()
+    frame_count = video_frame_count(path)
+    if jobs == 1 or frame_count <= 0:
+        return track_video(path, settings, lower, upper, roi)
+
+    tasks = [(path, settings, lower, upper, roi, start, stop, warmup) for start, stop in split_frames(frame_count, jobs)]
+    with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+        tracks = list(pool.map(_track_segment, tasks))
+    return stitch_tracks(tracks)
+
+
+def cached_track(path, cache=None, jobs=1, settings=VIDEO_SETTINGS, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER,
+                 roi=(0, 0, 800, 600)):
+    # marker track from the analysis cache, tracking (and storing) it on a miss
+    if cache is None:
+        return track_video_parallel(path, jobs, settings, lower, upper, roi)
+    key = cache.key(path, {'settings': settings, 'lower': lower, 'upper': upper, 'roi': roi})
+    track = cache.get(key)
+    if track is None:
+        track = track_video_parallel(path, jobs, settings, lower, upper, roi)
+        cache.put(key, track)
+    return track
+
+
+def fitted_origin(track, default):
+    # centre of the circle fitted to the marker orbit, or default if there are too few points
+    valid = track[:, 5] == 0
+    fit = fit_circle(track[valid, 2], track[valid, 3]) if valid.sum() >= 20 else None
+    return (fit[0], fit[1]) if fit is not None else tuple(default)
+
+
+def count_revolutions(track, settings=VIDEO_SETTINGS, gear_ratio=10, tube_length=15):
+    # per-revolution RPM/RCF of a whole track, vectorized so that downstream parameters
+    # can be changed and recomputed from a cached track in milliseconds.
+    # Segmented tracks are stitched before this step, so the unwrapped phase carries
+    # across the seams and no revolution is counted twice or dropped.
+    valid = track[:, 5] == 0
+    times = track[valid, 0]
+    cxo, cyo = settings['origin']
+    angles = marker_angles(track[valid, 2], track[valid, 3], cxo, cyo)
+    crossings = crossing_times(times, angles)
+    if len(crossings) == 0:
+        return []
+
+    # the first revolution has no period yet and falls back to the fitted velocity
+    rpm = np.empty(len(crossings))
+    rpm[0] = window_rpm(times, angles, times[np.searchsorted(times, crossings[0])])*gear_ratio
+    rpm[1:] = 60*gear_ratio/np.diff(crossings)
+    rcf = compute_rcf(rpm, tube_length)
+    return list(zip(range(1, len(crossings)+1), crossings, rpm, rcf))
+
+
+def replay_telemetry(track, telemetry, settings=VIDEO_SETTINGS, gear_ratio=10, tube_length=15):
+    # run the live per-frame estimator over a track and log every frame
+    tracker = make_tracker(settings, gear_ratio=gear_ratio, tube_length=tube_length)
+    for timestamp, frame_index, cx, cy, area, lost in track:
+        centroid = None if lost else (cx, cy)
+        result = tracker.update(centroid, timestamp)
+        telemetry.append(timestamp, frame_index, cx, cy, area, result['azimuth'], lost, result['rpm'])
+
+
+def write_revolutions(revolutions, stream):
+    writer = csv.writer(stream)
+    writer.writerow(['revolution', 'time_s', 'rpm', 'rcf'])
+    for rotation, timestamp, rpm, rcf in revolutions:
+        writer.writerow([rotation, '{:.4f}'.format(timestamp), '{:.2f}'.format(rpm), '{:.2f}'.format(rcf)])
+
+
+def write_rotor_revolutions(per_rotor, stream):
+    # per_rotor: [(name, revolutions)]
+    writer = csv.writer(stream)
+    writer.writerow(['rotor', 'revolution', 'time_s', 'rpm', 'rcf'])
+    for name, revolutions in per_rotor:
+        for rotation, timestamp, rpm, rcf in revolutions:
+            writer.writerow([name, rotation, '{:.4f}'.format(timestamp), '{:.2f}'.format(rpm), '{:.2f}'.format(rcf)])
+
+
+#------------------------ MAIN -------------------------
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Offline RPM/RCF analysis of a recorded spin test.')
+    parser.add_argument('video', help='recorded video file or frame cache directory')
+    parser.add_argument('-o', '--output', help='CSV file for per-revolution RPM/RCF (default: stdout)')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='video',
+                        help='origin and crop settings to use')
+    parser.add_argument('--gear-ratio', type=float, default=10)
+    parser.add_argument('--tube-length', type=float, default=15)
+    parser.add_argument('--lower', type=int, nargs=3, default=DEFAULT_LOWER, metavar=('R', 'G', 'B'),
+                        help='lower RGB thresholds in percent')
+    parser.add_argument('--upper', type=int, nargs=3, default=DEFAULT_UPPER, metavar=('R', 'G', 'B'),
+                        help='upper RGB thresholds in percent')
+    parser.add_argument('--roi', type=int, nargs=4, default=(0, 0, 800, 600), metavar=('X', 'Y', 'W', 'H'))
+    parser.add_argument('--telemetry', help='also write the per-frame telemetry log to this file')
+    parser.add_argument('--fit-origin', action='store_true',
+                        help='use the centre of the circle fitted to the marker orbit instead of the preset origin')
+    parser.add_argument('--rotors', metavar='JSON',
+                        help='track every rotor described in this file in one decoding pass '
+                             '(replaces --preset, --roi, thresholds, gear ratio and tube length)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='where marker tracks are cached between runs')
+    parser.add_argument('--cache-size', type=int, default=512, help='cache size limit in MB')
+    parser.add_argument('--no-cache', action='store_true', help='always decode and track the video')
+    parser.add_argument('--build-frame-cache', metavar='DIR',
+                        help='decode the video once into a frame cache in DIR and analyze that '
+                             '(cropped to --roi with --preset cam, whole frames with --preset video)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='split the video into this many time ranges tracked in parallel (0 = all cores)')
+    return parser
+
+
+def analyze_rotors(args):
+    rotors = load_rotors(args.rotors)
+    tracks = track_rotors(args.video, rotors)
+    per_rotor = []
+    for rotor in rotors:
+        tracker = rotor.tracker
+        origin = fitted_origin(tracks[rotor.name], tracker.origin) if args.fit_origin else tracker.origin
+        revolutions = count_revolutions(tracks[rotor.name], {'origin': origin},
+                                        tracker.gear_ratio, tracker.tube_length)
+        per_rotor.append((rotor.name, revolutions))
+        track = tracks[rotor.name]
+        print("{}: {} frames, {} lost, {} revolutions".format(rotor.name, len(track), int(track[:, 5].sum()),
+                                                              len(revolutions)), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', newline='') as stream:
+            write_rotor_revolutions(per_rotor, stream)
+    else:
+        write_rotor_revolutions(per_rotor, sys.stdout)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.rotors:
+        analyze_rotors(args)
+        return
+    settings = PRESETS[args.preset]
+
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir, args.cache_size << 20)
+    roi = tuple(args.roi)
+
+    video = args.video
+    if args.build_frame_cache:
+        digest = cache.video_digest(video) if cache is not None else None
+        # the video preset tracks whole frames (its origin is in frame coordinates), so only cam crops
+        video = build_frame_cache(video, args.build_frame_cache, roi if settings['crop'] else None, digest)
+
+    # only the tracking depends on the video and the segmentation parameters; gear ratio
+    # and tube length are applied afterwards, so changing them is served from the cache
+    track = cached_track(video, cache, args.jobs, settings, tuple(args.lower), tuple(args.upper), roi)
+    if args.fit_origin:
+        settings = dict(settings, origin=fitted_origin(track, settings['origin']))
+        print("fitted origin {:.1f} {:.1f}".format(*settings['origin']), file=sys.stderr)
+    revolutions = count_revolutions(track, settings, args.gear_ratio, args.tube_length)
+    if args.telemetry:
+        with TelemetryLog(args.telemetry) as telemetry:
+            replay_telemetry(track, telemetry, settings, args.gear_ratio, args.tube_length)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as stream:
+            write_revolutions(revolutions, stream)
+    else:
+        write_revolutions(revolutions, sys.stdout)
+
+    print("{} frames, {} lost, {} revolutions".format(len(track), int(track[:, 5].sum()), len(revolutions)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
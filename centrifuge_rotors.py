@@ -0,0 +1,63 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Several rotors watched by one camera. Every rotor has its own region of the frame, thresholds, *
+* origin, gear ratio and tube length, and its own tracker; all of them are fed from the same     *
+* decoded frame. Rotors are described in a JSON file:                                            *
+*                                                                                                *
+*   [{"name": "left", "roi": [0, 0, 600, 400], "origin": [200, 210],                             *
+*     "gear_ratio": 10, "tube_length": 15, "lower": [0, 12, 55], "upper": [44, 100, 100]}]       *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import json
+
+from centrifuge_tracker import DEFAULT_LOWER, DEFAULT_UPPER, MarkerTracker, crop_roi
+
+
+#------------------------ ROTORS -------------------------
+
+class Rotor:
+    '''One tracked rotor: a region of the frame and the tracker for its marker.'''
+
+    def __init__(self, name, tracker, roi=None):
+        self.name = name
+        self.tracker = tracker
+        self.roi = roi          # (x, y, width, height) as in crop_roi, None = whole frame
+
+    def crop(self, frame):
+        return frame if self.roi is None else crop_roi(frame, self.roi)
+
+    def process(self, frame, timestamp):
+        result = self.tracker.process(self.crop(frame), timestamp)
+        result['rotor'] = self.name
+        return result
+
+
+def rotor_from_config(config, index=0):
+    # origin is given in ROI coordinates, like the origin of the presets
+    tracker = MarkerTracker(tuple(config['origin']),
+                            gear_ratio=config.get('gear_ratio', 10),
+                            tube_length=config.get('tube_length', 15),
+                            lower=tuple(config.get('lower', DEFAULT_LOWER)),
+                            upper=tuple(config.get('upper', DEFAULT_UPPER)),
+                            fit_origin=config.get('fit_origin', False),
+                            kalman=config.get('kalman', False),
+                            polar=config.get('polar', False))
+    roi = config.get('roi')
+    return Rotor(config.get('name', 'rotor{}'.format(index+1)), tracker, tuple(roi) if roi else None)
+
+
+def load_rotors(path):
+    with open(path) as f:
+        configs = json.load(f)
+    if isinstance(configs, dict):
+        configs = configs['rotors']
+    return [rotor_from_config(config, i) for i, config in enumerate(configs)]
+
+#------------------------ END -------------------------
@@ -0,0 +1,287 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Validation station: several cameras or recordings checked at once. Every source is captured    *
+* and tracked in its own process, so each one gets a core and its own interpreter. Results come  *
+* back through one queue into a terminal dashboard and a single log merged in time order.        *
+*                                                                                                *
+* Usage: python centrifuge_station.py 0 1 2 --preset cam --log station.stn                       *
+*        python centrifuge_station.py --config station.json --log station.stn                    *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import json
+import time
+import heapq
+import queue
+import argparse
+import multiprocessing
+from collections import deque
+import cv2
+
+from centrifuge_history import STATION_DTYPE, STATION_MAGIC, TelemetryLog
+from centrifuge_tracker import CAM_SETTINGS, VIDEO_SETTINGS, DEFAULT_LOWER, DEFAULT_UPPER, crop_roi, make_tracker
+from centrifuge_video import LatestFrameCapture, frame_timestamp, is_frame_cache, open_video
+
+
+PRESETS = {'cam': CAM_SETTINGS, 'video': VIDEO_SETTINGS}
+
+DEFAULT_SOURCE = {
+    'preset': 'cam',
+    'roi': (0, 0, 800, 600),
+    'lower': DEFAULT_LOWER,
+    'upper': DEFAULT_UPPER,
+    'gear_ratio': 10,
+    'tube_length': 15,
+}
+
+# records sent per queue message; cameras send every frame to keep the dashboard current
+FILE_BATCH = 64
+
+
+#------------------------ CAPTURE PROCESS -------------------------
+
+def capture_worker(index, source, params, results, stop, session_start):
+    # runs in its own process: capture, track, and send
+    # (source, timestamp, frame_index, cx, cy, area, azimuth, lost, rpm) records plus
+    # the latest (rcf, rotations) through the results queue; always ends with 'finished'
+    cap = None
+    try:
+        settings = PRESETS[params['preset']]
+        camera = isinstance(source, int)
+        cap = open_video(source)
+        if camera:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 800)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 600)
+            cap = LatestFrameCapture(cap)
+        if cap.isOpened() == False:
+            results.put((index, 'error', "Error opening video stream or file {}".format(source)))
+            return
+
+        tracker = make_tracker(settings, gear_ratio=params['gear_ratio'], tube_length=params['tube_length'],
+                               lower=tuple(params['lower']), upper=tuple(params['upper']))
+        roi = tuple(params['roi'])
+        crop = settings['crop'] and not is_frame_cache(source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        batch_size = 1 if camera else FILE_BATCH
+
+        batch = []
+        frame_index = 0
+        result = None
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if ret == False:
+                break
+            # cameras share the wall clock; recordings are placed on it from the session start
+            timestamp = cap.timestamp if camera else session_start+frame_timestamp(cap, frame_index, fps)
+            result = tracker.process(crop_roi(frame, roi) if crop else frame, timestamp)
+            centroid = result['centroid'] or (0, 0)
+            batch.append((index, timestamp, frame_index, centroid[0], centroid[1], result['area'],
+                          result['azimuth'], result['lost'], result['rpm']))
+            if len(batch) >= batch_size:
+                results.put((index, 'records', (batch, result['rcf'], result['rotations'])))
+                batch = []
+            frame_index = frame_index+1
+
+        if batch:
+            results.put((index, 'records', (batch, result['rcf'], result['rotations'])))
+    except Exception as error:
+        results.put((index, 'error', "{}: {}".format(type(error).__name__, error)))
+    finally:
+        if cap is not None:
+            cap.release()
+        results.put((index, 'finished', None))
+
+
+#------------------------ MERGING -------------------------
+
+class TimeMerger:
+    '''Merges per-source record streams, each already in time order, into one.
+
+    A record is released once every source still running has reported a later
+    timestamp, so nothing that arrives afterwards can belong before it.
+    '''
+
+    def __init__(self, sources):
+        self.pending = [deque() for i in range(sources)]
+        self.latest = [float('-inf')]*sources
+        self.active = set(range(sources))
+
+    def add(self, source, records):
+        self.pending[source].extend(records)
+        if records:
+            self.latest[source] = records[-1][1]
+
+    def finish(self, source):
+        self.active.discard(source)
+
+    def release(self):
+        # records that are safe to write, in time order
+        if self.active:
+            watermark = min(self.latest[source] for source in self.active)
+        else:
+            watermark = float('inf')
+        ready = []
+        for stream in self.pending:
+            chunk = []
+            while stream and stream[0][1] <= watermark:
+                chunk.append(stream.popleft())
+            ready.append(chunk)
+        return list(heapq.merge(*ready, key=lambda record: record[1]))
+
+
+#------------------------ SESSION -------------------------
+
+class StationSession:
+    '''Starts one capture process per source and gathers their results.'''
+
+    def __init__(self, sources, log_path=None):
+        self.sources = sources          # [(source, params)]
+        self.log = TelemetryLog(log_path, dtype=STATION_DTYPE, magic=STATION_MAGIC) if log_path else None
+        self.merger = TimeMerger(len(sources))
+        self.results = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = []
+        self.exited = set()             # processes seen dead at the previous poll
+        self.status = [{'frames': 0, 'lost': 0, 'rpm': 0.0, 'rcf': 0.0, 'rotations': 0, 'times': deque(maxlen=60),
+                        'finished': False, 'error': None} for source in sources]
+
+    def start(self):
+        session_start = time.time()
+        for index, (source, params) in enumerate(self.sources):
+            process = multiprocessing.Process(target=capture_worker, name='station-{}'.format(index),
+                                              args=(index, source, params, self.results, self.stop_event,
+                                                    session_start), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def running(self):
+        return not all(status['finished'] for status in self.status)
+
+    def poll(self, timeout=0.1):
+        # handle the messages that arrive within timeout
+        deadline = time.time()+timeout
+        while True:
+            try:
+                index, kind, payload = self.results.get(timeout=max(deadline-time.time(), 0))
+            except queue.Empty:
+                break
+            self.handle(index, kind, payload)
+        # a process that died without reporting does not hold the others back; its last
+        # messages get one more poll to arrive
+        for index, process in enumerate(self.processes):
+            if process.exitcode is None or self.status[index]['finished']:
+                continue
+            if index in self.exited:
+                self.handle(index, 'error', "capture process exited with code {}".format(process.exitcode))
+                self.handle(index, 'finished', None)
+            self.exited.add(index)
+        self.write(self.merger.release())
+
+    def handle(self, index, kind, payload):
+        status = self.status[index]
+        if kind == 'records':
+            records, status['rcf'], status['rotations'] = payload
+            status['frames'] = status['frames']+len(records)
+            status['lost'] = status['lost']+sum(record[7] for record in records)
+            status['rpm'] = records[-1][8]
+            status['times'].extend(record[1] for record in records)
+            self.merger.add(index, records)
+        elif kind == 'error':
+            status['error'] = status['error'] or payload
+        elif kind == 'finished':
+            status['finished'] = True
+            self.merger.finish(index)
+
+    def write(self, records):
+        if self.log is not None:
+            for record in records:
+                self.log.append(*record)
+
+    def stop(self):
+        self.stop_event.set()
+        while self.running():
+            self.poll()
+        for process in self.processes:
+            process.join()
+        self.write(self.merger.release())
+        if self.log is not None:
+            self.log.close()
+
+    def dashboard(self):
+        lines = ["{:<3}{:<24}{:>8}{:>8}{:>11}{:>9}{:>6}  {}".format('#', 'source', 'frames', 'fps', 'RPM', 'RCF',
+                                                                   'revs', 'lost %')]
+        for index, ((source, params), status) in enumerate(zip(self.sources, self.status)):
+            times = status['times']
+            fps = (len(times)-1)/(times[-1]-times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+            state = status['error'] or ('finished' if status['finished'] else '')
+            lines.append("{:<3}{:<24}{:>8}{:>8.1f}{:>11.2f}{:>9.2f}{:>6}  {:.1f} {}".format(
+                index, str(source)[-24:], status['frames'], fps, status['rpm'], status['rcf'], status['rotations'],
+                100.0*status['lost']/max(status['frames'], 1), state))
+        return '\n'.join(lines)
+
+
+#------------------------ MAIN -------------------------
+
+def parse_source(text):
+    # camera index or file path
+    return int(text) if text.isdigit() else text
+
+
+def load_config(path):
+    # [{"source": 0, "preset": "cam", "lower": [...], ...}], missing keys take DEFAULT_SOURCE
+    with open(path) as f:
+        configs = json.load(f)
+    sources = []
+    for config in configs:
+        params = dict(DEFAULT_SOURCE)
+        params.update(config)
+        sources.append((params.pop('source'), params))
+    return sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Track several cameras or recordings in parallel processes.')
+    parser.add_argument('sources', nargs='*', help='camera indexes and/or video files')
+    parser.add_argument('--config', help='JSON list of sources with their own parameters')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default=DEFAULT_SOURCE['preset'])
+    parser.add_argument('--roi', type=int, nargs=4, default=DEFAULT_SOURCE['roi'], metavar=('X', 'Y', 'W', 'H'))
+    parser.add_argument('--lower', type=int, nargs=3, default=DEFAULT_SOURCE['lower'], metavar=('R', 'G', 'B'))
+    parser.add_argument('--upper', type=int, nargs=3, default=DEFAULT_SOURCE['upper'], metavar=('R', 'G', 'B'))
+    parser.add_argument('--gear-ratio', type=float, default=DEFAULT_SOURCE['gear_ratio'])
+    parser.add_argument('--tube-length', type=float, default=DEFAULT_SOURCE['tube_length'])
+    parser.add_argument('--log', help='merged, time-ordered log of every frame of every source')
+    parser.add_argument('--interval', type=float, default=1.0, help='dashboard refresh period, s')
+    args = parser.parse_args(argv)
+
+    sources = load_config(args.config) if args.config else []
+    params = {'preset': args.preset, 'roi': tuple(args.roi), 'lower': tuple(args.lower), 'upper': tuple(args.upper),
+              'gear_ratio': args.gear_ratio, 'tube_length': args.tube_length}
+    sources += [(parse_source(source), dict(params)) for source in args.sources]
+    if not sources:
+        parser.error('no sources given')
+
+    session = StationSession(sources, args.log)
+    session.start()
+    try:
+        shown = time.time()
+        while session.running():
+            session.poll()
+            if time.time()-shown >= args.interval:
+                print(session.dashboard()+'\n', flush=True)
+                shown = time.time()
+    except KeyboardInterrupt:
+        pass
+    session.stop()
+    print(session.dashboard())
+
+
+if __name__ == '__main__':
+    main()
+
+#------------------------ END -------------------------
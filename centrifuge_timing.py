@@ -0,0 +1,83 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Per-stage timing of the tracking loop. Every stage records its duration from the high-         *
+* resolution performance counter into a fixed-size ring buffer; percentiles are only computed    *
+* when the summary is read, so the timers can stay on during normal use.                         *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import csv
+from time import perf_counter
+import numpy as np
+
+
+TIMING_COLUMNS = ('stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+#------------------------ STAGE TIMER -------------------------
+
+class StageTimer:
+    '''Rolling window of the last durations of every named stage.
+
+    Usage in a loop, one counter read per stage:
+
+        start = perf_counter()
+        ...
+        start = timer.lap('blur', start)
+        ...
+        start = timer.lap('inRange', start)
+    '''
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.samples = {}       # stage -> ring buffer of durations, s (insertion order = loop order)
+        self.counts = {}
+
+    def record(self, stage, duration):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = [0.0]*self.window
+            self.counts[stage] = 0
+        count = self.counts[stage]
+        samples[count % self.window] = duration
+        self.counts[stage] = count+1
+
+    def lap(self, stage, start):
+        # record the time since start and return the current counter value
+        now = perf_counter()
+        self.record(stage, now-start)
+        return now
+
+    def summary(self):
+        # one row per stage (see TIMING_COLUMNS) over the samples in the window, in ms
+        rows = []
+        for stage, samples in list(self.samples.items()):
+            count = self.counts[stage]
+            recent = np.array(samples[:min(count, self.window)])*1000
+            p50, p95, p99 = np.percentile(recent, (50, 95, 99))
+            rows.append((stage, count, recent.mean(), p50, p95, p99, recent.max()))
+        return rows
+
+    def format(self):
+        lines = ["{:<11}{:>8}{:>8}{:>8}{:>8}".format('stage, ms', 'p50', 'p95', 'p99', 'max')]
+        for stage, count, mean, p50, p95, p99, peak in self.summary():
+            lines.append("{:<11}{:>8.3f}{:>8.3f}{:>8.3f}{:>8.3f}".format(stage, p50, p95, p99, peak))
+        return '\n'.join(lines)
+
+    def export(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(TIMING_COLUMNS)
+            for row in self.summary():
+                writer.writerow([row[0], row[1]]+['{:.4f}'.format(v) for v in row[2:]])
+
+#------------------------ END -------------------------
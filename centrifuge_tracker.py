@@ -0,0 +1,574 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Marker tracking pipeline (segmentation -> centroid -> azimuth -> revolutions) shared by the    *
+* GUI capture worker and the offline tools. Nothing in here depends on Qt.                       *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import time
+import math
+from time import perf_counter
+import cv2
+import numpy as np
+
+from centrifuge_estimators import TWO_PI, AngularVelocityEstimator, CircleFit, KalmanAngleEstimator, marker_angle
+from centrifuge_timing import StageTimer
+
+
+#------------------------ SETTINGS -------------------------
+# per-source presets
+CAM_SETTINGS = {
+    'origin': (350, 309),
+    'crop': True,
+}
+
+VIDEO_SETTINGS = {
+    'origin': (394, 401),
+    'crop': False,
+}
+
+# slider defaults in percent, RGB order
+DEFAULT_LOWER = (0, 12, 55)
+DEFAULT_UPPER = (44, 100, 100)
+
+
+#------------------------ FUNCTIONS -------------------------
+
+def crop_roi(frame, roi):
+    # roi = (x, y, width, height) as typed into the crop text boxes
+    x, y, w, h = roi
+    return frame[x:x+w, y:y+h]
+
+
+def threshold_bounds(lower, upper):
+    # slider percentages (R, G, B) -> BGR bounds for cv2.inRange
+    lowerB = np.array([int(lower[2]*2.55), int(lower[1]*2.55), int(lower[0]*2.55)], dtype=np.uint8)
+    upperB = np.array([int(upper[2]*2.55), int(upper[1]*2.55), int(upper[0]*2.55)], dtype=np.uint8)
+    return lowerB, upperB
+
+
+def clean_mask(maskB, kernelOpen):
+    # opening removes thin noise; specks that survive are rejected by area in find_marker
+    if kernelOpen is None:
+        return maskB
+    return cv2.morphologyEx(maskB, cv2.MORPH_OPEN, kernelOpen)
+
+
+def segment_marker(crop, lowerB, upperB, kernelOpen):
+    blur = cv2.blur(crop, (5, 5))
+    maskB = cv2.inRange(blur, lowerB, upperB)
+    return clean_mask(maskB, kernelOpen)
+
+
+def find_marker(mask, min_area=1, near=None):
+    # (centroid, area, (x, y, width, height)) of the best traveler blob, or (None, 0, None).
+    # The largest blob wins; when a position is expected, the closest of the
+    # blobs at least half as large as the largest one is taken instead.
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None, 0, None
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    largest = areas.max()
+    if largest < min_area:
+        return None, 0, None
+    candidates = np.flatnonzero(areas >= max(largest/2, min_area))
+    best = candidates[np.argmax(areas[candidates])]
+    if near is not None and len(candidates) > 1:
+        distance = np.hypot(centroids[candidates+1, 0]-near[0], centroids[candidates+1, 1]-near[1])
+        best = candidates[np.argmin(distance)]
+    cx, cy = centroids[best+1]
+    box = tuple(int(v) for v in stats[best+1, :4])
+    return (float(cx), float(cy)), int(areas[best]), box
+
+
+def compute_rcf(rpm, tube_length):
+    return 1.118*tube_length*rpm**2*1e-6
+
+
+#------------------------ COLOUR LUT -------------------------
+
+class ColourLUT:
+    '''Colour-membership lookup table trained from clicked marker and background pixels.
+
+    Samples are histogrammed on a coarse RGB grid, smoothed, and every cell where the
+    marker density beats the background density is accepted. Classification looks up
+    the grid cell of every pixel in one backprojection pass; at 5 bits the table stays in cache.
+    '''
+
+    def __init__(self, bits=5, spread=1):
+        self.bits = bits        # grid resolution per channel
+        self.spread = spread    # smoothing radius in grid cells
+        self.table = None
+        self.clear()
+
+    def clear(self):
+        self.marker_samples = []
+        self.background_samples = []
+
+    def add_samples(self, pixels, marker=True):
+        # pixels: any BGR uint8 array
+        pixels = np.asarray(pixels, np.uint8).reshape(-1, 3)
+        if marker:
+            self.marker_samples.append(pixels)
+        else:
+            self.background_samples.append(pixels)
+
+    def sample_count(self):
+        return (sum(len(p) for p in self.marker_samples), sum(len(p) for p in self.background_samples))
+
+    def _histogram(self, samples):
+        n = 1 << self.bits
+        hist = np.zeros((n, n, n), np.float64)
+        if not samples:
+            return hist
+        q = np.concatenate(samples) >> (8-self.bits)
+        np.add.at(hist, (q[:, 2], q[:, 1], q[:, 0]), 1)
+        # box smoothing along each axis so unseen neighbouring shades are accepted too
+        for axis in range(3):
+            padded = np.pad(hist, [(self.spread, self.spread) if a == axis else (0, 0) for a in range(3)])
+            hist = sum(np.take(padded, range(i, i+n), axis=axis) for i in range(2*self.spread+1))
+        return hist/hist.sum()
+
+    def build(self):
+        if not self.marker_samples:
+            raise ValueError("no marker samples")
+        marker = self._histogram(self.marker_samples)
+        background = self._histogram(self.background_samples)
+        coarse = ((marker > 0) & (marker > background)).astype(np.float32)*255
+        # a 3-D histogram indexed [b, g, r] like the image channels, not a 2-D image with 2**bits channels
+        self.table = cv2.Mat(np.ascontiguousarray(coarse.transpose(2, 1, 0)), wrap_channels=False)
+        return self
+
+    def classify(self, image):
+        # any BGR uint8 image (or array of pixels) -> 0/255 mask of the same height and width;
+        # the grid cell lookup is a single backprojection pass
+        return cv2.calcBackProject([image], [0, 1, 2], self.table, [0, 256]*3, 1)
+
+
+#------------------------ POLAR RING -------------------------
+
+class PolarRing:
+    '''Annulus around the origin unwrapped into a small angle x radius strip.
+
+    The cv2.remap tables are built once per origin and orbit radius; every frame
+    then costs one remap of the strip. The marker angle comes straight from the
+    angular profile of the segmented strip (columns = angle bins, rows = radii).
+    '''
+
+    def __init__(self, origin, radius, width=24, angle_bins=360, radial_bins=16):
+        self.origin = origin
+        self.radius = radius
+        self.angle_bins = angle_bins
+        inner = max(radius-width, 0)
+        self.radii = np.linspace(inner, radius+width, radial_bins)
+        self.radial_step = self.radii[1]-self.radii[0]
+        theta = (np.arange(angle_bins)+0.5)*TWO_PI/angle_bins
+        map_x = (origin[0]-self.radii[:, None]*np.sin(theta)[None, :]).astype(np.float32)
+        map_y = (origin[1]-self.radii[:, None]*np.cos(theta)[None, :]).astype(np.float32)
+        # integer tables with nearest-pixel sampling are the fastest remap; the blur
+        # of the segmentation smooths the strip afterwards
+        self.map, _ = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2, nninterpolation=True)
+
+    def unwrap(self, crop):
+        return cv2.remap(crop, self.map, None, cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT)
+
+    def find(self, mask, min_area=1):
+        # (centroid, area) in crop coordinates of the run of marker bins around the
+        # fullest angle, or (None, 0)
+        profile = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()//255
+        peak = int(np.argmax(profile))
+        if profile[peak] == 0:
+            return None, 0
+        bins = self.angle_bins
+        left = right = peak
+        while profile[(left-1) % bins] and right-left < bins-1:
+            left = left-1
+        while profile[(right+1) % bins] and right-left < bins-1:
+            right = right+1
+        columns = np.arange(left, right+1)
+        counts = profile[columns % bins]
+        total = int(counts.sum())
+        # sub-bin angle: weighted mean position of the run
+        angle = ((np.dot(columns, counts)/total+0.5)*TWO_PI/bins) % TWO_PI
+        rows = cv2.reduce(mask[:, columns % bins], 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()//255
+        radius = np.dot(self.radii, rows)/total
+        area = total*TWO_PI*radius/bins*self.radial_step
+        if area < min_area:
+            return None, 0
+        cxo, cyo = self.origin
+        return (cxo-radius*math.sin(angle), cyo-radius*math.cos(angle)), area
+
+
+#------------------------ TRACKER -------------------------
+
+class MarkerTracker:
+    '''Per-frame marker tracking state for one rotor.'''
+
+    def __init__(self, origin, kernel_open=5, min_area=30, velocity_window=0.5,
+                 gear_ratio=10, tube_length=15, lower=DEFAULT_LOWER, upper=DEFAULT_UPPER,
+                 local_search=True, search_radius=48, coarse_scale=4, fit_origin=False, kalman=False,
+                 polar=False, ring_width=24):
+        self.preset_origin = origin
+        self.origin = origin
+        self.origin_fit = CircleFit() if fit_origin else None   # origin from the orbit of the marker
+        self.classifier = None              # ColourLUT replacing the slider box when set
+        self.local_search = local_search
+        self.search_radius = search_radius  # half size of the predicted search window, px
+        self.coarse_scale = coarse_scale    # downscale factor of the re-acquisition search
+        self.polar = polar                  # search the annulus around the orbit first
+        self.ring_width = ring_width        # half width of that annulus, px
+        # the Kalman filter coasts through dropouts and weights blobs by their area
+        self.estimator = KalmanAngleEstimator() if kalman else AngularVelocityEstimator(velocity_window)
+        self.timer = StageTimer()           # per-stage durations, shared with the worker when tracking live
+        self.gear_ratio = gear_ratio
+        self.tube_length = tube_length
+        self.min_area = min_area            # smallest blob accepted as the marker, px
+        self.kernelOpen = np.ones((kernel_open, kernel_open), np.uint8) if kernel_open > 1 else None
+        self.set_thresholds(lower, upper)
+        self.reset()
+
+    def set_thresholds(self, lower, upper):
+        # a single attribute assignment, so the GUI thread may call this while tracking runs
+        self.bounds = threshold_bounds(lower, upper)
+
+    def reset(self):
+        self.azimuth = 0.0
+        self.rpm = 0.0
+        self.rcf = 0.0
+        self.revolution_rpm = 0.0
+        self.rotations = 0
+        self.radius = None
+        self.area = 0
+        self.expected_area = None   # running mean blob area, for the measurement quality
+        self.mask = None
+        self.window = None
+        self.ring = None
+        self.estimator.reset()
+        self.origin = self.preset_origin
+        if self.origin_fit is not None:
+            self.origin_fit.reset()
+
+    def segment(self, crop, coarse=False):
+        # the downscaled re-acquisition search relies on the area filter alone
+        kernelOpen = None if coarse else self.kernelOpen
+        timer = self.timer
+        start = perf_counter()
+        classifier = self.classifier
+        if classifier is not None:
+            maskB = classifier.classify(crop)
+            start = timer.lap('lut', start)
+        else:
+            lowerB, upperB = self.bounds
+            blur = cv2.blur(crop, (5, 5))
+            start = timer.lap('blur', start)
+            maskB = cv2.inRange(blur, lowerB, upperB)
+            start = timer.lap('inRange', start)
+        mask = clean_mask(maskB, kernelOpen)
+        timer.lap('open', start)
+        return mask
+
+    def find(self, mask, min_area, near=None):
+        start = perf_counter()
+        found = find_marker(mask, min_area, near)
+        self.timer.lap('components', start)
+        return found
+
+    #------------------------ MARKER SEARCH -------------------------
+    def predict_position(self, timestamp):
+        # expected marker position from the last radius, phase and angular velocity
+        phase = self.estimator.predict(timestamp)
+        if phase is None or self.radius is None:
+            return None
+        cxo, cyo = self.origin
+        return cxo-self.radius*math.sin(phase), cyo-self.radius*math.cos(phase)
+
+    def search_local(self, crop, center, recentre=True):
+        # segment only a small window around the expected position
+        h, w = crop.shape[:2]
+        x0 = min(max(int(center[0])-self.search_radius, 0), w)
+        y0 = min(max(int(center[1])-self.search_radius, 0), h)
+        x1 = min(max(int(center[0])+self.search_radius, 0), w)
+        y1 = min(max(int(center[1])+self.search_radius, 0), h)
+        if x1-x0 < 2 or y1-y0 < 2:
+            return None
+        window_mask = self.segment(crop[y0:y1, x0:x1])
+        self.mask[y0:y1, x0:x1] = window_mask
+        self.window = (x0, y0, x1, y1)
+        centroid, self.area, box = self.find(window_mask, self.min_area, (center[0]-x0, center[1]-y0))
+        if centroid is None:
+            return None
+        # a blob cut off by an inner edge of the window is only part of the marker;
+        # look again around it once, then leave it to the global search
+        bx, by, bw, bh = box
+        if ((bx == 0 and x0 > 0) or (by == 0 and y0 > 0) or (bx+bw == x1-x0 and x1 < w)
+                or (by+bh == y1-y0 and y1 < h)):
+            self.mask[y0:y1, x0:x1] = 0
+            self.window = None
+            self.area = 0
+            if not recentre:
+                return None
+            return self.search_local(crop, (centroid[0]+x0, centroid[1]+y0), recentre=False)
+        return centroid[0]+x0, centroid[1]+y0
+
+    def search_global(self, crop):
+        # coarse re-acquisition on a downscaled copy of the whole crop
+        scale = self.coarse_scale
+        if crop.shape[0] < scale or crop.shape[1] < scale:
+            # a crop smaller than one coarse pixel (ROI outside the frame or a tiny camera mode)
+            return None
+        small = cv2.resize(crop, (crop.shape[1]//scale, crop.shape[0]//scale), interpolation=cv2.INTER_AREA)
+        centroid, area, box = self.find(self.segment(small, coarse=True), max(self.min_area//(scale*scale), 1))
+        if centroid is None:
+            return None
+        self.area = area*scale*scale
+        return (centroid[0]+0.5)*scale, (centroid[1]+0.5)*scale
+
+    def polar_ring(self):
+        # annulus around the current orbit, rebuilt when the origin or the radius moves
+        if self.radius is None:
+            return None
+        ring = self.ring
+        if (ring is None or math.hypot(ring.origin[0]-self.origin[0], ring.origin[1]-self.origin[1]) > 1
+                or abs(ring.radius-self.radius) > self.ring_width/2):
+            self.ring = ring = PolarRing(self.origin, self.radius, self.ring_width)
+        return ring
+
+    def search_polar(self, crop):
+        ring = self.polar_ring()
+        if ring is None:
+            return None
+        start = perf_counter()
+        strip = ring.unwrap(crop)
+        self.timer.lap('remap', start)
+        mask = self.segment(strip)
+        start = perf_counter()
+        centroid, area = ring.find(mask, self.min_area)
+        self.timer.lap('profile', start)
+        if centroid is not None:
+            self.area = area
+        return centroid
+
+    def locate(self, crop, timestamp):
+        # marker centroid in crop coordinates, or None if it has been lost
+        if not self.local_search:
+            self.mask = self.segment(crop)
+            centroid, self.area, box = self.find(self.mask, self.min_area, self.predict_position(timestamp))
+            return centroid
+
+        if self.mask is None or self.mask.shape != crop.shape[:2]:
+            self.mask = np.zeros(crop.shape[:2], np.uint8)
+        elif self.window is not None:
+            x0, y0, x1, y1 = self.window
+            self.mask[y0:y1, x0:x1] = 0
+        self.window = None
+        self.area = 0
+
+        if self.polar:
+            centroid = self.search_polar(crop)
+            if centroid is not None:
+                return centroid
+
+        predicted = self.predict_position(timestamp)
+        if predicted is not None:
+            centroid = self.search_local(crop, predicted)
+            if centroid is not None:
+                return centroid
+
+        coarse = self.search_global(crop)
+        if coarse is None:
+            return None
+        # refine the coarse position at full resolution
+        return self.search_local(crop, coarse) or coarse
+
+    #------------------------ ANGLE AND REVOLUTIONS -------------------------
+    def update(self, centroid, timestamp):
+        # azimuth and revolution logic for an already located centroid (None = lost)
+        crossing_time = None
+        if centroid is not None and self.origin_fit is not None:
+            # the preset origin is only a starting guess once the fitted circle is reliable;
+            # a blob far off the fitted orbit is treated as a lost marker
+            if not self.origin_fit.add(centroid[0], centroid[1]):
+                centroid = None
+            elif self.origin_fit.ready:
+                self.origin = self.origin_fit.centre
+        cxo, cyo = self.origin
+        if centroid is not None:
+            self.azimuth = marker_angle(centroid[0], centroid[1], cxo, cyo)
+            self.radius = math.hypot(centroid[0]-cxo, centroid[1]-cyo)
+            # a partly hidden blob is smaller than usual and its centroid less precise
+            area = max(self.area, 1)
+            self.expected_area = area if self.expected_area is None else 0.9*self.expected_area+0.1*area
+            quality = min(area/self.expected_area, 1.0)
+            crossing_time = self.estimator.update(self.azimuth, timestamp, quality)
+        else:
+            crossing_time = self.estimator.coast(timestamp)
+
+        # tubes RPM from the fitted handle velocity, refreshed on every frame
+        self.rpm = self.estimator.rpm()*self.gear_ratio
+        self.rcf = compute_rcf(self.rpm, self.tube_length)
+
+        # per-revolution RPM from the interpolated crossing times
+        new_revolution = crossing_time is not None
+        if new_revolution:
+            period = self.estimator.revolution_period
+            self.revolution_rpm = 60*self.gear_ratio/period if period else self.rpm
+            self.rotations = self.estimator.revolutions
+
+        return {
+            'timestamp': timestamp,
+            'centroid': centroid,
+            'lost': centroid is None,
+            'area': self.area if centroid is not None else 0,
+            'azimuth': self.azimuth,
+            'phase': self.estimator.phase,
+            'omega': self.estimator.omega,
+            'rpm': self.rpm,
+            'rpm_sigma': self.estimator.rpm_sigma()*self.gear_ratio,
+            'rcf': self.rcf,
+            'rotations': self.rotations,
+            'new_revolution': new_revolution,
+            'crossing_time': crossing_time,
+            'revolution_rpm': self.revolution_rpm,
+            'revolution_rcf': compute_rcf(self.revolution_rpm, self.tube_length),
+        }
+
+    def process(self, crop, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        centroid = self.locate(crop, timestamp)
+        start = perf_counter()
+        result = self.update(centroid, timestamp)
+        self.timer.lap('update', start)
+        result['mask'] = self.mask
+        return result
+
+
+def make_tracker(settings, **kwargs):
+    params = dict((k, v) for k, v in settings.items() if k != 'crop')
+    params.update(kwargs)
+    return MarkerTracker(**params)
+
+
+#------------------------ OVERLAY -------------------------
+
+font = cv2.FONT_HERSHEY_SIMPLEX
+WHITE = (255, 255, 255)
+
+
+class Sprite:
+    '''A pre-rendered patch composited onto frames with its own coverage.
+
+    draw(image, paint) renders the patch in local coordinates; paint maps a colour
+    to the value drawn, so the same calls produce the premultiplied colour patch
+    and the single-channel coverage.
+    '''
+
+    def __init__(self, x, y, width, height, draw):
+        self.x, self.y = x, y
+        self.colour = np.zeros((height, width, 3), np.uint8)
+        coverage = np.zeros((height, width), np.uint8)
+        draw(self.colour, lambda colour: colour)
+        draw(coverage, lambda colour: 255)
+        self.inverse = cv2.cvtColor(255-coverage, cv2.COLOR_GRAY2BGR)
+
+    def composite(self, output):
+        h, w = self.colour.shape[:2]
+        x0, y0 = max(self.x, 0), max(self.y, 0)
+        x1, y1 = min(self.x+w, output.shape[1]), min(self.y+h, output.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        lx, ly = x0-self.x, y0-self.y
+        roi = output[y0:y1, x0:x1]
+        kept = cv2.multiply(roi, self.inverse[ly:ly+y1-y0, lx:lx+x1-x0], scale=1/255.0)
+        roi[:] = cv2.add(kept, self.colour[ly:ly+y1-y0, lx:lx+x1-x0])
+
+
+def text_sprite(text, org, colour=WHITE, scale=1, thickness=2):
+    (w, h), baseline = cv2.getTextSize(text, font, scale, thickness)
+    pad = thickness
+    return Sprite(org[0]-pad, org[1]-h-pad, w+2*pad, h+baseline+2*pad,
+                  lambda image, paint: cv2.putText(image, text, (pad, h+pad), font, scale,
+                                                   paint(colour), thickness, cv2.LINE_AA))
+
+
+def origin_sprite(origin):
+    # origin dot and the upward azimuth reference arrow
+    size = 64
+    def draw(image, paint):
+        cv2.circle(image, (size, size), 10, paint((0, 255, 255)), -1)
+        cv2.arrowedLine(image, (size, size), (size, size-50), paint(WHITE), 2)
+    return Sprite(origin[0]-size, origin[1]-size, 2*size, 2*size, draw)
+
+
+class OverlayRenderer:
+    '''Draws the tracking overlay from cached sprites.
+
+    The title, the lost warning and the origin arrow are rendered once, and the
+    revolution count only when it changes. Angle, RPM, RCF and the timer change on
+    almost every frame and are drawn directly, like the marker, radius and circumference.
+    '''
+
+    def __init__(self, blend_mask=True):
+        self.blend_mask = blend_mask
+        self.title = text_sprite("MTU MOST Centrifuge CAM", (20, 30), (55, 255, 255))
+        self.lost = text_sprite('Marker has been lost', (200, 250), (0, 0, 255))
+        self.origin = None
+        self.origin_layer = None
+        self.labels = {}
+
+    def label(self, org, text):
+        cached = self.labels.get(org)
+        if cached is None or cached[0] != text:
+            cached = (text, text_sprite(text, org))
+            self.labels[org] = cached
+        return cached[1]
+
+    def text(self, output, org, text):
+        cv2.putText(output, text, org, font, 1, WHITE, 2, cv2.LINE_AA)
+
+    def draw(self, crop, mask, result, origin, frame_time=0.0, tracing=True):
+        if self.blend_mask:
+            # same as blending the grey mask at 0.4 over the frame
+            output = cv2.convertScaleAbs(crop, alpha=1-0.4)
+            x, y, w, h = cv2.boundingRect(mask)
+            if w:
+                roi = np.ascontiguousarray(output[y:y+h, x:x+w])
+                cv2.add(roi, (102, 102, 102, 0), roi, mask=mask[y:y+h, x:x+w])
+                output[y:y+h, x:x+w] = roi
+        else:
+            output = crop.copy()
+
+        if tracing and result is not None:
+            cxo, cyo = int(round(origin[0])), int(round(origin[1]))
+            if not result['lost']:
+                cxb, cyb = int(result['centroid'][0]), int(result['centroid'][1])
+                self.text(output, (400, 100), "Angle       = {:.2f}".format(result['azimuth']*180/np.pi))
+                self.label((400, 150), "Revolutions = {:.0f}".format(result['rotations'])).composite(output)
+                self.text(output, (400, 200), "Tubes RPM = {:.2f}".format(result['rpm']))
+                self.text(output, (400, 250), "Tubes RCF  = {:.2f}".format(result['rcf']))
+
+                cv2.circle(output, (cxb, cyb), 10, (255, 250, 0), -1)
+                # radius
+                cv2.line(output, (cxo, cyo), (cxb, cyb), (0, 255, 0), 3)
+                radius = int(np.sqrt((cxb-cxo)**2+(cyb-cyo)**2))
+                # circumference
+                cv2.circle(output, (cxo, cyo), radius, (0, 255, 0), 2)
+            else:
+                self.lost.composite(output)
+
+            if self.origin != (cxo, cyo):
+                self.origin = (cxo, cyo)
+                self.origin_layer = origin_sprite(self.origin)
+            self.origin_layer.composite(output)
+
+        self.title.composite(output)
+        self.text(output, (400, 550), "Timer  = {:.2f}".format(frame_time))
+        return output
+
+#------------------------ END -------------------------
@@ -0,0 +1,296 @@
+'''***********************************************************************************************
+*                                                                                                *
+*                       Open Source Completely 3D Printable Centrifuge                           *
+*                     Michigan Tech Open Sustainability Technology Lab                           *
+*                                                                                                *
+* Video input/output helpers: container timestamps, latest-frame camera capture, the decoded-ROI *
+* frame cache and the background video recorder. A frame cache is a directory holding the        *
+* cropped frames of a recording as one memory-mapped uint8 stack, so threshold tuning passes can *
+* run over it repeatedly without any codec cost.                                                 *
+*                                                                                                *
+***********************************************************************************************'''
+
+#!/usr/bin/env python
+
+# ------------------- REQUIRED MODULES ------------------
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+import cv2
+import numpy as np
+
+
+FRAME_CACHE_META = 'meta.json'
+FRAME_CACHE_FRAMES = 'frames.u8'
+FRAME_CACHE_TIMES = 'timestamps.npy'
+
+
+#------------------------ FUNCTIONS -------------------------
+
+def frame_timestamp(cap, index, fps):
+    # container timestamp in seconds, falling back to frame index / fps
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if msec > 0 or index == 0:
+        return msec/1000.0
+    return index/fps
+
+
+def is_frame_cache(source):
+    return isinstance(source, str) and os.path.isfile(os.path.join(source, FRAME_CACHE_META))
+
+
+def open_video(source):
+    # cv2.VideoCapture, or a FrameCacheCapture for a frame cache directory
+    if is_frame_cache(source):
+        return FrameCacheCapture(source)
+    return cv2.VideoCapture(source)
+
+
+#------------------------ LIVE CAPTURE -------------------------
+
+class LatestFrameCapture:
+    '''Grabs camera frames on a background thread and keeps only the newest one.
+
+    read() returns the newest frame not returned before, waiting for one if needed.
+    Frames the consumer was too slow for are dropped and counted, so the result
+    always refers to a current frame. timestamp is the wall-clock time at which the
+    frame returned by the last read() was grabbed.
+    '''
+
+    def __init__(self, cap):
+        self.cap = cap
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = None
+        self.sequence = 0           # frames grabbed so far
+        self.consumed = 0           # sequence number of the frame last returned
+        self.dropped = 0
+        self.timestamp = None
+        self.grab_times = deque(maxlen=60)
+        self.running = cap.isOpened()
+        self.thread = threading.Thread(target=self._run, name='LatestFrameCapture', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                break
+            grabbed = time.time()
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                break
+            with self.condition:
+                self.frame, self.frame_time = frame, grabbed
+                self.grab_times.append(grabbed)
+                self.sequence = self.sequence+1
+                self.condition.notify()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        with self.condition:
+            while self.sequence == self.consumed and self.running:
+                self.condition.wait()
+            if self.sequence == self.consumed:
+                return False, None
+            if self.consumed:
+                self.dropped = self.dropped+self.sequence-self.consumed-1
+            self.consumed = self.sequence
+            self.timestamp = self.frame_time
+            return True, self.frame
+
+    def fps(self):
+        # frame rate the device delivers, over the last grabbed frames
+        times = list(self.grab_times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times)-1)/(times[-1]-times[0])
+
+    def discard(self):
+        # forget the frames grabbed so far without counting them as dropped (after a pause)
+        with self.condition:
+            if self.consumed:
+                self.consumed = self.sequence
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.running = False
+        self.thread.join()
+        self.cap.release()
+
+
+#------------------------ FRAME CACHE -------------------------
+
+def build_frame_cache(video_path, directory, roi=None, digest=None):
+    # decode a recording once, crop every frame to the ROI and store the stack
+    cap = cv2.VideoCapture(video_path)
+    if cap.isOpened() == False:
+        raise IOError("Error opening video file {}".format(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    os.makedirs(directory, exist_ok=True)
+    timestamps = []
+    shape = None
+    with open(os.path.join(directory, FRAME_CACHE_FRAMES), 'wb') as f:
+        while True:
+            ret, frame = cap.read()
+            if ret == False:
+                break
+            timestamps.append(frame_timestamp(cap, len(timestamps), fps))
+            if roi is not None:
+                x, y, w, h = roi
+                frame = frame[x:x+w, y:y+h]
+            frame = np.ascontiguousarray(frame)
+            if shape is None:
+                shape = frame.shape
+            f.write(frame.data)
+    cap.release()
+
+    np.save(os.path.join(directory, FRAME_CACHE_TIMES), np.array(timestamps))
+    meta = {
+        'source': os.path.abspath(video_path),
+        'source_digest': digest,
+        'roi': roi,
+        'fps': fps,
+        'count': len(timestamps),
+        'shape': shape,
+    }
+    with open(os.path.join(directory, FRAME_CACHE_META), 'w') as f:
+        json.dump(meta, f, default=list)
+    return directory
+
+
+def load_frame_cache(directory):
+    # (frames, timestamps, meta); frames is a read-only (N, H, W, 3) memmap
+    with open(os.path.join(directory, FRAME_CACHE_META)) as f:
+        meta = json.load(f)
+    timestamps = np.load(os.path.join(directory, FRAME_CACHE_TIMES))
+    if meta['count'] == 0:
+        return np.zeros((0, 1, 1, 3), np.uint8), timestamps, meta
+    frames = np.memmap(os.path.join(directory, FRAME_CACHE_FRAMES), np.uint8, 'r',
+                       shape=(meta['count'],)+tuple(meta['shape']))
+    return frames, timestamps, meta
+
+
+class FrameCacheCapture:
+    '''cv2.VideoCapture look-alike reading from a frame cache directory.'''
+
+    def __init__(self, directory):
+        self.frames, self.timestamps, self.meta = load_frame_cache(directory)
+        self.position = 0
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened or self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position = self.position+1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.timestamps[max(self.position-1, 0)]*1000.0 if len(self.timestamps) else 0.0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.frames))
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.meta['fps'])
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frames.shape[2])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frames.shape[1])
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(min(max(value, 0), len(self.frames)))
+            return True
+        return False
+
+    def release(self):
+        self.opened = False
+
+#------------------------ RECORDER -------------------------
+
+class VideoRecorder:
+    '''Encodes frames on a background thread fed through a bounded queue.
+
+    write() never blocks: when the encoder falls behind and the queue is full the
+    frame is dropped and counted. The output frame rate is measured from the
+    timestamps of the first measure_frames frames instead of being fixed.
+    '''
+
+    def __init__(self, path, fourcc='MJPG', queue_size=64, measure_frames=30):
+        self.path = path
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.measure_frames = measure_frames
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.fps = None
+        self.thread = threading.Thread(target=self._run, name='VideoRecorder', daemon=True)
+        self.thread.start()
+
+    def write(self, frame, timestamp):
+        try:
+            self.queue.put_nowait((frame, timestamp))
+        except queue.Full:
+            self.dropped = self.dropped+1
+
+    def close(self):
+        self.queue.put((None, None))
+        self.thread.join()
+
+    def _run(self):
+        writer = None
+        pending = []
+        while True:
+            frame, timestamp = self.queue.get()
+            if frame is None:
+                break
+            if writer is None:
+                # hold the first frames back until the capture rate is known
+                pending.append((frame, timestamp))
+                if len(pending) < self.measure_frames:
+                    continue
+                writer = self._open(pending)
+                for held, _ in pending:
+                    writer.write(held)
+                self.written = self.written+len(pending)
+                pending = []
+                continue
+            writer.write(frame)
+            self.written = self.written+1
+
+        if writer is None and pending:
+            writer = self._open(pending)
+            for held, _ in pending:
+                writer.write(held)
+            self.written = self.written+len(pending)
+        if writer is not None:
+            writer.release()
+
+    def _open(self, frames):
+        span = frames[-1][1]-frames[0][1]
+        self.fps = (len(frames)-1)/span if len(frames) > 1 and span > 0 else 10.0
+        height, width = frames[0][0].shape[:2]
+        return cv2.VideoWriter(self.path, self.fourcc, self.fps, (width, height))
+
+#------------------------ END -------------------------
@@ -19,6 +19,7 @@
 #!/usr/bin/env python
 
 # ------------------- REQUIRED MODULES ------------------
+import os
 import sys
 import cv2
 import time
@@ -32,6 +33,7 @@ from PyQt5.QtCore import Qt
 from PyQt5 import QtWidgets, QtGui
 from PyQt5.QtWidgets import QApplication, QWidget, QSlider, QComboBox, QInputDialog, QLineEdit, QFileDialog
 from PyQt5.QtGui import QIcon
+from time import perf_counter
 
 from matplotlib import pyplot as plt
 from matplotlib.patches import Polygon
@@ -48,6 +50,12 @@ else:
         FigureCanvas, NavigationToolbar2QT as NavigationToolbar)
 from matplotlib.figure import Figure
 
+from centrifuge_tracker import CAM_SETTINGS, VIDEO_SETTINGS, ColourLUT, make_tracker
+from centrifuge_engine import AutoTuneWorker, ModeProbeWorker, TrackingWorker
+from centrifuge_history import SessionHistory
+from centrifuge_camera import choose_mode, describe_mode, roi_frame_size
+from centrifuge_rotors import load_rotors
+
 
 #-------------------------- WIDGET ----------------------------
 class App(QWidget):
@@ -78,7 +86,18 @@ class App(QWidget):
         self.lbl_BIG_RCF.setFont(QtGui.QFont('Sans',18,QtGui.QFont.Bold))
 
         self.btn_CAM = QtWidgets.QPushButton('Open CAM')
+        self.combo_CAMERA = QComboBox()
+        self.combo_CAMERA.addItems(['CAM {}'.format(i) for i in range(4)])
+        self.combo_CAM_MODE = QComboBox()
+        self.combo_CAM_MODE.setToolTip('Pixel format, resolution and frame rate; the fastest mode covering the ROI is preselected')
+        self.lbl_CAM_FPS = QtWidgets.QLabel('')
         self.btn_OPEN_VID = QtWidgets.QPushButton('Open Video')
+        self.btn_LOAD_ROTORS = QtWidgets.QPushButton('Load Rotors')
+        self.btn_LOAD_ROTORS.setToolTip('Track additional rotors described in a JSON file on the same frames')
+        self.lbl_ROTORS = QtWidgets.QLabel('')
+        self.lbl_ROTORS.setFont(QtGui.QFont('Monospace', 9))
+        self.btn_PAUSE = QtWidgets.QPushButton('Pause')
+        self.btn_STOP = QtWidgets.QPushButton('Stop')
 
         self.lbl_CENTR_PARAMS = QtWidgets.QLabel('Set centrifuge parameters')
         self.lbl_CENTR_PARAMS.setAlignment(Qt.AlignLeft)
@@ -98,6 +117,12 @@ class App(QWidget):
         self.btn_SET_ROI = QtWidgets.QPushButton('SET VALUES AND CROP')
         self.btn_SET_ROI.setStyleSheet("QPushButton {background-color: #6495ED;}")
 
+        self.btn_BUILD_LUT = QtWidgets.QPushButton('Build Colour LUT')
+        self.btn_BUILD_LUT.setToolTip('Left-click marker pixels and right-click background pixels in the video window first')
+        self.btn_CLEAR_LUT = QtWidgets.QPushButton('Use RGB Sliders')
+        self.btn_AUTO_TUNE = QtWidgets.QPushButton('Auto-Tune')
+        self.btn_AUTO_TUNE.setToolTip('Search RGB thresholds on frames sampled from the open camera or video')
+
         self.btn_TRACE_MARKERS = QtWidgets.QPushButton('TRACE MARKERS')
         self.btn_TRACE_MARKERS.setStyleSheet("QPushButton {background-color: #6495ED;}")
         self.btn_SET_GEAR_RATIO = QtWidgets.QPushButton('  Set Gear Ratio  ')
@@ -114,6 +139,27 @@ class App(QWidget):
 
         self.btn_RCF_OF_RPM = QtWidgets.QPushButton('PLOT RCF(RPM) FUNCTION')
         self.btn_RESET_TIMER = QtWidgets.QPushButton('Reset Timer')
+        self.chk_TELEMETRY = QtWidgets.QCheckBox('Save telemetry')
+        self.chk_TELEMETRY.setToolTip('Log every traced frame to telemetry_<date>_<time>.tlm')
+        self.chk_RECORD = QtWidgets.QCheckBox('Record video')
+        self.chk_RECORD.setToolTip('Write the annotated frames to video_out_<date>_<time>.avi')
+        self.chk_FIT_ORIGIN = QtWidgets.QCheckBox('Fit origin')
+        self.chk_FIT_ORIGIN.setToolTip('Estimate the rotation centre from the marker orbit instead of the preset origin')
+        self.chk_FIT_ORIGIN.setChecked(True)
+        self.chk_KALMAN = QtWidgets.QCheckBox('Kalman filter')
+        self.chk_KALMAN.setToolTip('Filter the marker angle and keep estimating the RPM while the marker is hidden')
+        self.chk_KALMAN.setChecked(True)
+        self.chk_POLAR = QtWidgets.QCheckBox('Polar ring')
+        self.chk_POLAR.setToolTip('Search the marker in a strip unwrapped from the annulus around its orbit')
+        self.chk_MASK = QtWidgets.QCheckBox('Show mask')
+        self.chk_MASK.setToolTip('Blend the threshold mask into the displayed frames')
+        self.chk_MASK.setChecked(True)
+        self.chk_MASK.toggled.connect(self.chk_MASK_function)
+
+        self.lbl_TIMINGS = QtWidgets.QLabel('')
+        self.lbl_TIMINGS.setFont(QtGui.QFont('Monospace', 9))
+        self.lbl_TIMINGS.setToolTip('Rolling per-stage processing times of the last frames')
+        self.btn_EXPORT_TIMINGS = QtWidgets.QPushButton('Export Timings')
 
         self.lbl_TIMER = QtWidgets.QLabel('Spinning Time: ')
         self.lbl_TIMER_seconds = QtWidgets.QLabel('')
@@ -151,9 +197,9 @@ class App(QWidget):
         #self._dynamic_ax2 = self._dynamic_ax.twinx() # use the same x-axis for the self._dynamic_ax2
         #self._dynamic_ax2.set_ylabel('Relative Centrifugal Force, N',color=self.color)
         #self._dynamic_ax2.tick_params(axis='y',labelcolor=self.color)
+        self.init_chart()
         self._timer = dynamic_canvas.new_timer(100, [(self._update_canvas, (), {})])
         self._timer.start()
-        t = np.linspace(0, 100, 100)
         #------------------------------------------------------
         
         self.btn_matplotlib = QtWidgets.QPushButton('3D Fused Plot')
@@ -171,36 +217,50 @@ class App(QWidget):
         self.slider_R_lower.setTickPosition(QSlider.TicksAbove)
         self.slider_R_lower.setTickInterval(4)
         self.slider_R_lower.setSingleStep(2)
+        self.slider_R_lower.setRange(0, 100)
 
         self.slider_R_upper = QSlider(Qt.Horizontal)
         self.slider_R_upper.setFocusPolicy(Qt.StrongFocus)
         self.slider_R_upper.setTickPosition(QSlider.TicksAbove)
         self.slider_R_upper.setTickInterval(4)
         self.slider_R_upper.setSingleStep(2)
+        self.slider_R_upper.setRange(0, 100)
 
         self.slider_G_lower = QSlider(Qt.Horizontal)
         self.slider_G_lower.setFocusPolicy(Qt.StrongFocus)
         self.slider_G_lower.setTickPosition(QSlider.TicksAbove)
         self.slider_G_lower.setTickInterval(4)
         self.slider_G_lower.setSingleStep(2)
+        self.slider_G_lower.setRange(0, 100)
 
         self.slider_G_upper = QSlider(Qt.Horizontal)
         self.slider_G_upper.setFocusPolicy(Qt.StrongFocus)
         self.slider_G_upper.setTickPosition(QSlider.TicksAbove)
         self.slider_G_upper.setTickInterval(4)
         self.slider_G_upper.setSingleStep(2)
+        self.slider_G_upper.setRange(0, 100)
 
         self.slider_B_lower = QSlider(Qt.Horizontal)
         self.slider_B_lower.setFocusPolicy(Qt.StrongFocus)
         self.slider_B_lower.setTickPosition(QSlider.TicksAbove)
         self.slider_B_lower.setTickInterval(4)
         self.slider_B_lower.setSingleStep(2)
+        self.slider_B_lower.setRange(0, 100)
 
         self.slider_B_upper = QSlider(Qt.Horizontal)
         self.slider_B_upper.setFocusPolicy(Qt.StrongFocus)
         self.slider_B_upper.setTickPosition(QSlider.TicksAbove)
         self.slider_B_upper.setTickInterval(4)
         self.slider_B_upper.setSingleStep(2)
+        self.slider_B_upper.setRange(0, 100)
+
+        # start at the thresholds in effect (before the change handlers are connected)
+        self.slider_R_lower.setValue(self.slider_R_lower_value)
+        self.slider_G_lower.setValue(self.slider_G_lower_value)
+        self.slider_B_lower.setValue(self.slider_B_lower_value)
+        self.slider_R_upper.setValue(self.slider_R_upper_value)
+        self.slider_G_upper.setValue(self.slider_G_upper_value)
+        self.slider_B_upper.setValue(self.slider_B_upper_value)
         
 
         #---------------------------- LAYOUT --------------------------		
@@ -211,10 +271,12 @@ class App(QWidget):
         layout_H_G = QtWidgets.QHBoxLayout()
         layout_H_B = QtWidgets.QHBoxLayout()
         layout_H_CAM = QtWidgets.QHBoxLayout()
+        layout_H_CAM_MODE = QtWidgets.QHBoxLayout()
 
         layout_H_GEARS = QtWidgets.QHBoxLayout()
         layout_H_TUBES = QtWidgets.QHBoxLayout()
         layout_H_TIMER = QtWidgets.QHBoxLayout()
+        layout_H_LUT = QtWidgets.QHBoxLayout()
 
         layout_V = QtWidgets.QVBoxLayout()
         layout_V2 = QtWidgets.QVBoxLayout()
@@ -240,7 +302,15 @@ class App(QWidget):
         layout_V.addLayout(layout_H_TUBES)
         layout_H_CAM.addWidget(self.btn_CAM)
         layout_H_CAM.addWidget(self.btn_OPEN_VID)
+        layout_H_CAM.addWidget(self.btn_LOAD_ROTORS)
+        layout_H_CAM.addWidget(self.btn_PAUSE)
+        layout_H_CAM.addWidget(self.btn_STOP)
         layout_V.addLayout(layout_H_CAM)
+        layout_H_CAM_MODE.addWidget(self.combo_CAMERA)
+        layout_H_CAM_MODE.addWidget(self.combo_CAM_MODE)
+        layout_H_CAM_MODE.addWidget(self.lbl_CAM_FPS)
+        layout_V.addLayout(layout_H_CAM_MODE)
+        layout_V.addWidget(self.lbl_ROTORS)
 
         layout_V.addWidget(self.lbl_blank_space)
         layout_V.addWidget(self.lbl_CROP_ROI)
@@ -274,6 +344,11 @@ class App(QWidget):
         layout_H_B.addWidget(self.slider_B_upper)
         layout_V.addLayout(layout_H_B)
 
+        layout_H_LUT.addWidget(self.btn_BUILD_LUT)
+        layout_H_LUT.addWidget(self.btn_CLEAR_LUT)
+        layout_H_LUT.addWidget(self.btn_AUTO_TUNE)
+        layout_V.addLayout(layout_H_LUT)
+
         layout_V.addWidget(self.btn_TRACE_MARKERS)
         #layout_V.addWidget(self.lbl_blank_space)
 
@@ -281,12 +356,20 @@ class App(QWidget):
 
         layout_H_TIMER.addWidget(self.btn_RESET_TIMER)
         layout_H_TIMER.addWidget(self.lbl_TIMER_seconds)
+        layout_H_TIMER.addWidget(self.chk_TELEMETRY)
+        layout_H_TIMER.addWidget(self.chk_RECORD)
+        layout_H_TIMER.addWidget(self.chk_MASK)
+        layout_H_TIMER.addWidget(self.chk_FIT_ORIGIN)
+        layout_H_TIMER.addWidget(self.chk_KALMAN)
+        layout_H_TIMER.addWidget(self.chk_POLAR)
         layout_V.addLayout(layout_H_TIMER)
         
         layout_H.addLayout(layout_V)
         
         #------------------------- 2ND COLUMN -------------------------
         layout_V2.addWidget(dynamic_canvas)
+        layout_V2.addWidget(self.lbl_TIMINGS)
+        layout_V2.addWidget(self.btn_EXPORT_TIMINGS)
         layout_H.addLayout(layout_V2)
         
         #------------------------- COMBINED ---------------------------
@@ -295,7 +378,12 @@ class App(QWidget):
 		
         #------------------------ CONNECTIONS -------------------------
         self.btn_CAM.clicked.connect(self.btn_CAM_0_click_function)
+        self.combo_CAMERA.currentIndexChanged.connect(self.combo_CAMERA_function)
         self.btn_OPEN_VID.clicked.connect(self.btn_OPEN_VID_click_function)
+        self.btn_LOAD_ROTORS.clicked.connect(self.btn_LOAD_ROTORS_function)
+        self.btn_PAUSE.clicked.connect(self.btn_PAUSE_function)
+        self.btn_STOP.clicked.connect(self.btn_STOP_function)
+        self.btn_EXPORT_TIMINGS.clicked.connect(self.btn_EXPORT_TIMINGS_function)
         self.slider_R_lower.valueChanged.connect(self.slider_R_lower_change)
         self.slider_R_upper.valueChanged.connect(self.slider_R_upper_change)
         self.slider_G_lower.valueChanged.connect(self.slider_G_lower_change)
@@ -307,7 +395,11 @@ class App(QWidget):
         self.btn_TRACE_MARKERS.clicked.connect(self.btn_TRACE_MARKERS_function)
         self.btn_SET_ROI.clicked.connect(self.btn_SET_ROI_function)
         self.btn_RCF_OF_RPM.clicked.connect(self.btn_RCF_OF_RPM_function)
+        self.btn_BUILD_LUT.clicked.connect(self.btn_BUILD_LUT_function)
+        self.btn_CLEAR_LUT.clicked.connect(self.btn_CLEAR_LUT_function)
+        self.btn_AUTO_TUNE.clicked.connect(self.btn_AUTO_TUNE_function)
 
+        self.probe_camera_modes(self.combo_CAMERA.currentIndex())
         self.show()
 		
     #------------------------ VARIABLES -------------------------
@@ -329,21 +421,34 @@ class App(QWidget):
 
     
     spin_time = time.time() # for app timer
-    start_timer = time.time() # for frame timer
     trace_markers_FLAG = 0 # button is not pressed
+    worker = None # capture/tracking thread
+    colour_lut = ColourLUT() # trained colour classifier
+    use_colour_lut = False
+    mouse_callback_set = False
+    autotune_worker = None
+    camera_device = None # camera index held by the tracking worker
+    probing_devices = set() # cameras whose modes are being listed
+    postponed_probe = None # camera to list once the tracking worker releases it
     
     azimuth = 0
     rpm = 0
+    rpm_sigma = 0
     rcf = 0
     rotations = 0
-    count = 0
-    prev_count = 0
-    previous_time = 0
 
     graph_x_size = 100
     graph_step = 0
-    rpm2=np.zeros(graph_x_size) # to plot the graph
-    rcf2=np.zeros(graph_x_size) # to plot the graph
+    history = SessionHistory() # every revolution of the session, to plot the graph
+    chart_version = 0 # bumped on every new revolution
+    chart_drawn_version = 0
+    chart_min_top = 100 # lowest upper y-limit of the chart, rpm
+    timer = None # stage timings of the current (or last) worker
+    timings_tick = 0
+    dropped_frames = 0 # camera frames skipped to keep the results current
+    rotors = [] # additional rotors tracked on the same frames
+    rotor_histories = [] # one SessionHistory per additional rotor
+    rotor_values = [] # latest (rpm, rcf) per additional rotor
 
     font = cv2.FONT_HERSHEY_SIMPLEX
 
@@ -351,274 +456,271 @@ class App(QWidget):
     #------------------------ FUNCTIONS -------------------------
 
     def btn_CAM_0_click_function(self):
-        cap = cv2.VideoCapture(0)
-        #cap.set(cv2.CAP_PROP_FPS, 60)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 800)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 600)
-
-        # check if camera opened successfully
-        if (cap.isOpened()== False): 
-            print("Error opening video stream or file")
- 
-        # get frame resolution
-        frame_width = int(cap.get(3))
-        frame_height = int(cap.get(4))
- 
-        # define the codec and create VideoWriter object.The output is stored in 'out_cam_processed.avi' file.
-        out = cv2.VideoWriter('video_out.avi',cv2.VideoWriter_fourcc('M','J','P','G'), 10, (frame_width,frame_height))
-
-        while(cap.isOpened()):
-            ret, frame = cap.read()
-            
-            if ret==True:
-                crop = frame[self.Crop_X_Start:self.Crop_X_Start+self.Crop_Width, self.Crop_Y_Start:self.Crop_Y_Start+self.Crop_Height]
-                blur = cv2.blur(crop,(5,5))
-                # find the traveler
-                lowerB=np.array([int(self.slider_B_lower_value*2.55),int(self.slider_G_lower_value*2.55),int(self.slider_R_lower_value*2.55)])
-                upperB=np.array([int(self.slider_B_upper_value*2.55),int(self.slider_G_upper_value*2.55),int(self.slider_R_upper_value*2.55)])
-                maskB=cv2.inRange(blur,lowerB,upperB)
-                # opening and closing
-                kernelOpen=np.ones((5,5))
-                kernelClose=np.ones((15,15))
-
-                maskOpenB=cv2.morphologyEx(maskB,cv2.MORPH_OPEN,kernelOpen)
-                maskCloseB=cv2.morphologyEx(maskOpenB,cv2.MORPH_CLOSE,kernelClose)
-                maskCloseB_rgb = cv2.cvtColor(maskCloseB, cv2.COLOR_GRAY2BGR)
-
-                # create transparent mask
-                overlay = crop.copy()
-                output = crop.copy()
-                cv2.addWeighted(maskCloseB_rgb, 0.4, output, 1-0.4,0, output)
-
-                # origin
-                cxo = 350
-                cyo = 309
-
-                if self.trace_markers_FLAG == 1:
-                    self.start_timer = time.time()
-                    # traveler
-                    im2b,contsb,hb=cv2.findContours(maskCloseB.copy(),cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)
-
-                    if np.shape(contsb)[0] == 1:
-                        cntB = contsb[0]
-                        Mb = cv2.moments(cntB)
-                        cxb = int(Mb['m10']/Mb['m00'])+self.Crop_X_Start
-                        cyb = int(Mb['m01']/Mb['m00'])+self.Crop_Y_Start
-                        cv2.putText(output,("Angle       = {:.2f}".format(self.azimuth*180/np.pi)),(400,100),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        #cv2.putText(output,("Timer  = {:.2f}".format(time.time()-self.start_timer)),(20,100),self.font,0.8,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Revolutions = {:.0f}".format(self.rotations)),(400,150),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Tubes RPM = {:.2f}".format(self.rpm)),(400,200),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Tubes RCF  = {:.2f}".format(1.118*15*(self.rpm**2)*1e-6)),(400,250),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                    else:
-                        cxb = cxo
-                        cyb = cxo
-                        cv2.putText(output,'Marker has been lost',(200,250),self.font,1,(0,0,255),2,cv2.LINE_AA)
-
-
-                    cv2.circle(output,(cxo,cyo),10,(0,255,0),-1)
-                    cv2.circle(output,(cxb,cyb),10,(255,250,0),-1)
-
-                    # radius
-                    cv2.line(output,(cxo,cyo),(cxb,cyb),(0,255,0),3)
-                    radius = int(np.sqrt((np.absolute(cxb-cxo))**2+(np.absolute(cyb-cyo))**2))
-
-                    # circumference
-                    cv2.circle(output,(cxo,cyo),10,(0,255,255),-1)
-                    cv2.circle(output,(cxo,cyo),radius,(0,255,0),2)
-
-                    # azimuth
-                    cv2.arrowedLine(output,(cxo,cyo),(cxo,cyo-50),(255,255,255),2)
-
-                    # calculate azimuth
-                    #self.azimuth = np.arcsin((cxb-cxo)/radius)
-                    if cxb==cxo or cyb==cyo:
-                        pass
-                    elif cxb<cxo and cyb<cyo:
-                        self.azimuth=np.arcsin((cxo-cxb)/radius)
-                    elif cxb<cxo and cyb>cyo:
-                        self.azimuth=np.arcsin((cxo-cxb)/radius)+np.pi/2
-                    elif cxb>cxo and cyb>cyo:
-                        self.azimuth=np.arcsin((cxb-cxo)/radius)+np.pi
-                    elif cxb>cxo and cyb<cyo:
-                        self.azimuth=np.arcsin((cxb-cxo)/radius)+np.pi*3/2
-
-                    # calculate RPM (values 0.85 and 9 have been calibrated experimentally)
-                    if np.round(self.azimuth,2) <= 0.85 and (self.count-self.prev_count)>9:
-                        self.count=0
-                        self.rpm = 60*self.gear_ratio/(time.time()-self.previous_time)
-                        self.rcf = 1.118*self.tube_length*self.rpm**2*1e-6
-                        self.previous_time = time.time()
-                        self.rotations = self.rotations+1
-                        self.prev_count = self.count
-                        self.rpm2[self.rotations] = self.rpm # goes to plot
-                        self.rcf2[self.rotations] = self.rcf # goes to plot
-
-                        if self.rotations >= self.graph_x_size:
-                            self.rotations = 0
-                            self._dynamic_ax.clear()
-                            self.rpm2=np.zeros(self.graph_x_size)
-                            self.rcf2=np.zeros(self.graph_x_size)
-
-                        self.rpm2[self.rotations] = self.rpm # goes to plot
-                        self.rcf2[self.rotations] = self.rcf # goes to plot
-                    
-                    self.count = self.count+1
-                #-----------------------------end of trace_markers_FLAG-----------------------------------------------------
-
-                cv2.putText(output,"MTU MOST Centrifuge CAM",(20,30),self.font,1,(55,255,255),2,cv2.LINE_AA)  
-                cv2.putText(output,("Timer  = {:.2f}".format(time.time()-self.start_timer)),(400,550),self.font,1,(255,255,255),2,cv2.LINE_AA) 
-                
-                # write a video file
-                #out.write(output) 
-                # display the output frame
-                cv2.imshow("MTU MOST Centrifuge", output)  
-           
-                # Press Q on keyboard to exit
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    # release the video capture object and close all frames
-                    cap.release()
-                    cv2.destroyAllWindows()
-                    break
-            else:
-                break
-#-----------------------end of btn_CAM_0_click_function------------------------------------------------------------------
-
-
-#----------------------------------------------------------------------------------------------------------------------------
-    def btn_OPEN_VID_click_function(self):
-        cap = cv2.VideoCapture('video/v7.avi')
-        #cap.set(cv2.CAP_PROP_FPS, 60)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 800)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 600)
-
-        # check if camera opened successfully
-        if (cap.isOpened()== False): 
-            print("Error opening video stream or file")
- 
-        # get frame resolution
-        frame_width = int(cap.get(3))
-        frame_height = int(cap.get(4))
- 
-        # define the codec and create VideoWriter object.The output is stored in 'out_cam_processed.avi' file.
-        #out = cv2.VideoWriter('out_vid_processed.avi',cv2.VideoWriter_fourcc('M','J','P','G'), 10, (frame_width,frame_height))
-
-        while(cap.isOpened()):
-            ret, frame = cap.read()
-            
-            if ret==True:
-                #crop = frame[self.Crop_X_Start:self.Crop_X_Start+self.Crop_Width, self.Crop_Y_Start:self.Crop_Y_Start+self.Crop_Height]
-                crop = frame.copy()
-                blur = cv2.blur(crop,(5,5))
-                # find the traveler
-                lowerB=np.array([int(self.slider_B_lower_value*2.55),int(self.slider_G_lower_value*2.55),int(self.slider_R_lower_value*2.55)])
-                upperB=np.array([int(self.slider_B_upper_value*2.55),int(self.slider_G_upper_value*2.55),int(self.slider_R_upper_value*2.55)])
-                maskB=cv2.inRange(blur,lowerB,upperB)
-                # opening and closing
-                kernelOpen=np.ones((5,5))
-                kernelClose=np.ones((10,10))
-
-                maskOpenB=cv2.morphologyEx(maskB,cv2.MORPH_OPEN,kernelOpen)
-                maskCloseB=cv2.morphologyEx(maskOpenB,cv2.MORPH_CLOSE,kernelClose)
-                maskCloseB_rgb = cv2.cvtColor(maskCloseB, cv2.COLOR_GRAY2BGR)
-
-                # create transparent mask
-                overlay = crop.copy()
-                output = crop.copy()
-                cv2.addWeighted(maskCloseB_rgb, 0.4, output, 1-0.4,0, output)
-
-                # origin
-                cxo = 394
-                cyo = 401
-
-                if self.trace_markers_FLAG == 1:
-                    self.start_timer = time.time()
-                    # traveler
-                    im2b,contsb,hb=cv2.findContours(maskCloseB.copy(),cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)
-
-                    if np.shape(contsb)[0] == 1:
-                        cntB = contsb[0]
-                        Mb = cv2.moments(cntB)
-                        cxb = int(Mb['m10']/Mb['m00'])+self.Crop_X_Start
-                        cyb = int(Mb['m01']/Mb['m00'])+self.Crop_Y_Start
-                        cv2.putText(output,("Angle       = {:.2f}".format(self.azimuth*180/np.pi)),(400,100),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        #cv2.putText(output,("Timer  = {:.2f}".format(time.time()-self.start_timer)),(20,100),self.font,0.8,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Revolutions = {:.0f}".format(self.rotations)),(400,150),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Tubes RPM = {:.2f}".format(self.rpm)),(400,200),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                        cv2.putText(output,("Tubes RCF  = {:.2f}".format(1.118*15*(self.rpm**2)*1e-6)),(400,250),self.font,1,(255,255,255),2,cv2.LINE_AA)
-                    else:
-                        cxb = cxo
-                        cyb = cxo
-                        cv2.putText(output,'Marker has been lost',(200,250),self.font,1,(0,0,255),2,cv2.LINE_AA)
-
-
-                    cv2.circle(output,(cxo,cyo),10,(0,255,0),-1)
-                    cv2.circle(output,(cxb,cyb),10,(255,250,0),-1)
-
-                    # radius
-                    cv2.line(output,(cxo,cyo),(cxb,cyb),(0,255,0),3)
-                    radius = int(np.sqrt((np.absolute(cxb-cxo))**2+(np.absolute(cyb-cyo))**2))
-
-                    # circumference
-                    cv2.circle(output,(cxo,cyo),10,(0,255,255),-1)
-                    cv2.circle(output,(cxo,cyo),radius,(0,255,0),2)
-
-                    # azimuth
-                    cv2.arrowedLine(output,(cxo,cyo),(cxo,cyo-50),(255,255,255),2)
-
-                    # calculate azimuth
-                    #self.azimuth = np.arcsin((cxb-cxo)/radius)
-                    if cxb==cxo or cyb==cyo:
-                        pass
-                    elif cxb<cxo and cyb<cyo:
-                        self.azimuth=np.arcsin((cxo-cxb)/radius)
-                    elif cxb<cxo and cyb>cyo:
-                        self.azimuth=np.arcsin((cxo-cxb)/radius)+np.pi/2
-                    elif cxb>cxo and cyb>cyo:
-                        self.azimuth=np.arcsin((cxb-cxo)/radius)+np.pi
-                    elif cxb>cxo and cyb<cyo:
-                        self.azimuth=np.arcsin((cxb-cxo)/radius)+np.pi*3/2
-
-                    # calculate RPM (values 0.85 and 9 have been calibrated experimentally)
-                    #if np.round(self.azimuth,2) <= 0.85 and (self.count-self.prev_count)>9:
-                    # calculate RPM (values 0.75 and 8 have been calibrated experimentally)
-                    if np.round(self.azimuth,2) <= 0.75 and (self.count-self.prev_count)>8:
-                        self.count=0
-                        self.rpm = 60*self.gear_ratio/(time.time()-self.previous_time)
-                        self.rcf = 1.118*self.tube_length*self.rpm**2*1e-6
-                        self.previous_time = time.time()
-                        self.rotations = self.rotations+1
-                        self.prev_count = self.count
-                        if self.rotations >= self.graph_x_size:
-                            self.rotations = 0
-                            self._dynamic_ax.clear()
-                            self.rpm2=np.zeros(self.graph_x_size)
-                            self.rcf2=np.zeros(self.graph_x_size)
-
-                        self.rpm2[self.rotations] = self.rpm # goes to plot
-                        self.rcf2[self.rotations] = self.rcf # goes to plot
-                    
-                    self.count = self.count+1
-                #-----------------------------end of trace_markers_FLAG-----------------------------------------------------
-
-                cv2.putText(output,"MTU MOST Centrifuge CAM",(20,30),self.font,1,(55,255,255),2,cv2.LINE_AA)  
-                cv2.putText(output,("Timer  = {:.2f}".format(time.time()-self.start_timer)),(400,550),self.font,1,(255,255,255),2,cv2.LINE_AA) 
-                
-                # write a video file
-                #out.write(output) 
-                # display the output frame
-                cv2.imshow("MTU MOST Centrifuge", output)  
-           
-                # Press Q on keyboard to exit
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    # release the video capture object and close all frames
-                    cap.release()
-                    cv2.destroyAllWindows()
-                    break
-            else:
-                break
-# ---------------------------end of btn_OPEN_VID_click_function-----------------------------------------------------------------
+        device = self.combo_CAMERA.currentIndex()
+        if device in self.probing_devices:
+            return
+        self.start_worker(device, CAM_SETTINGS, self.combo_CAM_MODE.currentData())
+        self.camera_device = device
+
+
+    def btn_LOAD_ROTORS_function(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Load Rotors', '', 'Rotor files (*.json)')
+        if not path:
+            return
+        self.rotors = load_rotors(path)
+        self.rotor_histories = [SessionHistory() for rotor in self.rotors]
+        self.rotor_values = [(0.0, 0.0) for rotor in self.rotors]
+        print("Loaded {} rotors, they are tracked from the next start".format(len(self.rotors)))
+
+
+    def on_rotor_processed(self, index, result):
+        self.rotor_values[index] = (result['rpm'], result['rcf'])
+        if result['new_revolution']:
+            self.rotor_histories[index].append(result['crossing_time'], result['revolution_rpm'], result['revolution_rcf'])
+
+
+    def combo_CAMERA_function(self, index):
+        self.combo_CAM_MODE.clear()
+        self.probe_camera_modes(index)
+
+
+    def probe_camera_modes(self, device):
+        # a device the tracking worker holds is probed once it has been released
+        if device == self.camera_device:
+            self.postponed_probe = device
+            return
+        if device not in self.probing_devices:
+            # owned by the widget, so a probe still running when the camera changes is not destroyed
+            probe = ModeProbeWorker(device, self)
+            probe.modes_listed.connect(self.on_camera_modes_listed)
+            probe.finished.connect(probe.deleteLater)
+            self.probing_devices.add(device)
+            probe.start()
+        self.update_btn_CAM()
+
+
+    def update_btn_CAM(self):
+        # Open CAM waits for the probe of the selected device
+        self.btn_CAM.setEnabled(self.combo_CAMERA.currentIndex() not in self.probing_devices)
+
+
+    def release_camera(self):
+        self.camera_device = None
+        device, self.postponed_probe = self.postponed_probe, None
+        if device is not None and device == self.combo_CAMERA.currentIndex():
+            self.probe_camera_modes(device)
+
+
+    def on_camera_modes_listed(self, device, modes):
+        # fill the mode list of the device and preselect the fastest mode covering the ROI
+        self.probing_devices.discard(device)
+        self.update_btn_CAM()
+        if device != self.combo_CAMERA.currentIndex():
+            return
+        self.combo_CAM_MODE.clear()
+        roi = (self.Crop_X_Start, self.Crop_Y_Start, self.Crop_Width, self.Crop_Height)
+        best = choose_mode(modes, roi_frame_size(roi))
+        for mode in sorted(modes, key=lambda m: (-m.fps, m.width*m.height)):
+            self.combo_CAM_MODE.addItem(describe_mode(mode), mode)
+            if mode == best:
+                self.combo_CAM_MODE.setCurrentIndex(self.combo_CAM_MODE.count()-1)
 
 
+    def btn_OPEN_VID_click_function(self):
+        # a recording, or the meta.json of a frame cache built by centrifuge_offline.py
+        path, _ = QFileDialog.getOpenFileName(self, 'Open Video', 'video',
+                                              'Videos (*.avi *.mp4 *.mov *.mkv);;Frame cache (meta.json);;All files (*)')
+        if not path:
+            return
+        if os.path.basename(path) == 'meta.json':
+            path = os.path.dirname(path)
+        self.start_worker(path, VIDEO_SETTINGS)
+        self.release_camera()
+
+
+    def start_worker(self, source, settings, camera_mode=None):
+        self.stop_worker()
+        for rotor, history in zip(self.rotors, self.rotor_histories):
+            rotor.tracker.reset()
+            history.clear()
+        tracker = make_tracker(settings, gear_ratio=self.gear_ratio, tube_length=self.tube_length,
+                               fit_origin=self.chk_FIT_ORIGIN.isChecked(), kalman=self.chk_KALMAN.isChecked(),
+                               polar=self.chk_POLAR.isChecked())
+        self.set_tracker_thresholds(tracker)
+        if self.use_colour_lut:
+            tracker.classifier = self.colour_lut
+        roi = (self.Crop_X_Start, self.Crop_Y_Start, self.Crop_Width, self.Crop_Height)
+        telemetry_path = None
+        if self.chk_TELEMETRY.isChecked():
+            telemetry_path = time.strftime('telemetry_%Y%m%d_%H%M%S.tlm')
+        record_path = None
+        if self.chk_RECORD.isChecked():
+            record_path = time.strftime('video_out_%Y%m%d_%H%M%S.avi')
+
+        self.worker = TrackingWorker(source, tracker, settings, roi,
+                                     telemetry_path=telemetry_path, record_path=record_path,
+                                     camera_mode=camera_mode, rotors=self.rotors)
+        self.worker.tracing = self.trace_markers_FLAG == 1
+        self.timer = self.worker.timer
+        self.dropped_frames = 0
+        self.worker.overlay.blend_mask = self.chk_MASK.isChecked()
+        self.worker.frame_processed.connect(self.on_frame_processed)
+        self.worker.frame_ready.connect(self.on_frame_ready)
+        self.worker.rotor_processed.connect(self.on_rotor_processed)
+        self.worker.stream_finished.connect(self.on_stream_finished)
+        self.worker.start()
+        self.btn_PAUSE.setText('Pause')
+
+
+    def chk_MASK_function(self, checked):
+        if self.worker is not None:
+            self.worker.overlay.blend_mask = checked
+
+
+    def stop_worker(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker.wait()
+            self.worker = None
+            self.camera_device = None
+
+
+    def on_frame_processed(self, result):
+        self.azimuth = result['azimuth']
+        self.rpm = result['rpm']
+        self.rpm_sigma = result['rpm_sigma']
+        self.rcf = result['rcf']
+        self.dropped_frames = result.get('dropped_frames', 0)
+        if result['new_revolution']:
+            self.history.append(result['crossing_time'], result['revolution_rpm'], result['revolution_rcf']) # goes to plot
+            self.rotations = len(self.history)
+            self.chart_version = self.chart_version+1
+
+
+    def on_frame_ready(self, output):
+        # display the output frame
+        start = perf_counter()
+        cv2.imshow("MTU MOST Centrifuge", output)
+        if not self.mouse_callback_set:
+            cv2.setMouseCallback("MTU MOST Centrifuge", self.on_mouse)
+            self.mouse_callback_set = True
+        if self.worker is not None:
+            self.worker.frame_displayed()
+
+        # Press Q on keyboard to exit
+        key = cv2.waitKey(1) & 0xFF
+        if self.timer is not None:
+            self.timer.lap('display', start)
+        if key == ord('q'):
+            self.btn_STOP_function()
+
+
+    def on_stream_finished(self):
+        if self.sender() is self.worker:
+            self.release_camera()
+        cv2.destroyAllWindows()
+        self.mouse_callback_set = False
+
+
+    def on_mouse(self, event, x, y, flags, param):
+        # left click samples the marker colour, right click samples the background
+        if event not in (cv2.EVENT_LBUTTONDOWN, cv2.EVENT_RBUTTONDOWN):
+            return
+        if self.worker is None or self.worker.last_crop is None:
+            return
+        patch = self.worker.last_crop[max(y-3, 0):y+4, max(x-3, 0):x+4]
+        self.colour_lut.add_samples(patch, marker=event == cv2.EVENT_LBUTTONDOWN)
+        print("LUT samples: marker = {}, background = {}".format(*self.colour_lut.sample_count()))
+
+
+    def btn_BUILD_LUT_function(self):
+        try:
+            self.colour_lut.build()
+        except ValueError:
+            print("Left-click the marker in the video window to sample its colour first")
+            return
+        self.use_colour_lut = True
+        if self.worker is not None:
+            self.worker.tracker.classifier = self.colour_lut
+
+
+    def btn_CLEAR_LUT_function(self):
+        self.use_colour_lut = False
+        self.colour_lut.clear()
+        if self.worker is not None:
+            self.worker.tracker.classifier = None
+
+
+    def btn_PAUSE_function(self):
+        if self.worker is None:
+            return
+        if self.worker.is_paused():
+            self.worker.resume()
+            self.btn_PAUSE.setText('Pause')
+        else:
+            self.worker.pause()
+            self.btn_PAUSE.setText('Resume')
+
+
+    def btn_STOP_function(self):
+        self.stop_worker()
+        self.release_camera()
+        cv2.destroyAllWindows()
+        self.mouse_callback_set = False
+
+
+    def btn_EXPORT_TIMINGS_function(self):
+        if self.timer is None:
+            print("No timings yet, open a camera or video first")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Export stage timings', time.strftime('timings_%Y%m%d_%H%M%S.csv'),
+                                              'CSV files (*.csv)')
+        if path:
+            self.timer.export(path)
+
+
+    def btn_AUTO_TUNE_function(self):
+        if self.worker is None or len(self.worker.recent_crops) < 4:
+            print("Open a camera or video first, auto-tuning needs a few frames to sample")
+            return
+        if self.autotune_worker is not None and self.autotune_worker.isRunning():
+            return
+        start = ((self.slider_R_lower_value, self.slider_G_lower_value, self.slider_B_lower_value),
+                 (self.slider_R_upper_value, self.slider_G_upper_value, self.slider_B_upper_value))
+        self.autotune_worker = AutoTuneWorker(list(self.worker.recent_crops), self.worker.tracker.origin, start)
+        self.autotune_worker.tuning_finished.connect(self.on_tuning_finished)
+        self.btn_AUTO_TUNE.setEnabled(False)
+        self.autotune_worker.start()
+
+
+    def on_tuning_finished(self, tuned):
+        lower, upper, score = tuned
+        self.btn_AUTO_TUNE.setEnabled(True)
+        print("Auto-tune: lower = {}, upper = {}, score = {:.3f}".format(lower, upper, score))
+        if score <= 0:
+            return
+        # applied directly: a slider already at the tuned value would emit no valueChanged
+        self.slider_R_lower_value, self.slider_G_lower_value, self.slider_B_lower_value = lower
+        self.slider_R_upper_value, self.slider_G_upper_value, self.slider_B_upper_value = upper
+        self.update_worker_thresholds()
+        for slider, value in ((self.slider_R_lower, lower[0]), (self.slider_G_lower, lower[1]),
+                              (self.slider_B_lower, lower[2]), (self.slider_R_upper, upper[0]),
+                              (self.slider_G_upper, upper[1]), (self.slider_B_upper, upper[2])):
+            slider.blockSignals(True)
+            slider.setValue(value)
+            slider.blockSignals(False)
+
+
+    def set_tracker_thresholds(self, tracker):
+        tracker.set_thresholds(
+            (self.slider_R_lower_value, self.slider_G_lower_value, self.slider_B_lower_value),
+            (self.slider_R_upper_value, self.slider_G_upper_value, self.slider_B_upper_value))
+
+
+    def update_worker_thresholds(self):
+        if self.worker is not None:
+            self.set_tracker_thresholds(self.worker.tracker)
+
 
     def btn_SET_ROI_function(self):
         self.Crop_X_Start = np.int64(self.textbox_CROP_X.text())
@@ -629,42 +731,52 @@ class App(QWidget):
 
     def btn_TRACE_MARKERS_function(self):
         self.trace_markers_FLAG = 1
+        if self.worker is not None:
+            self.worker.tracing = True
 
     def btn_RESET_TIMER_function(self):
         self.spin_time = time.time()
 
     def slider_R_lower_change(self):
         self.slider_R_lower_value = self.slider_R_lower.value()
+        self.update_worker_thresholds()
         print("R lower  = {:.2f}".format(self.slider_R_lower_value))
 
     def slider_R_upper_change(self):
         self.slider_R_upper_value = self.slider_R_upper.value()
+        self.update_worker_thresholds()
         print("R upper  = {:.2f}".format(self.slider_R_upper_value))
 
     def slider_G_lower_change(self):
         self.slider_G_lower_value = self.slider_G_lower.value()
+        self.update_worker_thresholds()
         print("G lower  = {:.2f}".format(self.slider_G_lower_value))
 
     def slider_G_upper_change(self):
         self.slider_G_upper_value = self.slider_G_upper.value()
+        self.update_worker_thresholds()
         print("G upper  = {:.2f}".format(self.slider_G_upper_value))
 
     def slider_B_lower_change(self):
         self.slider_B_lower_value = self.slider_B_lower.value()
+        self.update_worker_thresholds()
         print("B lower  = {:.2f}".format(self.slider_B_lower_value))
 
     def slider_B_upper_change(self):
         self.slider_B_upper_value = self.slider_B_upper.value()
+        self.update_worker_thresholds()
         print("B upper  = {:.2f}".format(self.slider_B_upper_value))
 
 
     def btn_SET_GEAR_RATIO_clicked(self):
         self.gear_ratio = float(self.textbox_GEAR_RATIO.text())
+        if self.worker is not None:
+            self.worker.tracker.gear_ratio = self.gear_ratio
 
 
     def btn_RCF_OF_RPM_function(self):
         figure_1 = plt.figure('RCF(RPM) Function')
-        plt.plot(self.rpm2,self.rcf2,'o',color='#0000FF') # experimental data
+        plt.plot(self.history.column('rpm'),self.history.column('rcf'),'o',color='#0000FF') # experimental data
 
         tt = np.linspace(0,20*self.graph_x_size,self.graph_x_size)
         plt.plot(tt,1.118*self.tube_length*tt**2*1e-6,color='#DC143C') # theoretical data
@@ -676,33 +788,94 @@ class App(QWidget):
         plt.show(figure_1)
 
 
-    def _update_canvas(self):
-        
-        self._dynamic_ax.set_title('Sound')
-        t = np.linspace(0, self.graph_x_size, self.graph_x_size)
-        self._dynamic_ax.clear()
-
-        # Shift the sinusoid as a function of time.
-        self._dynamic_ax.plot(t,self.rpm2,color='#696969')
-        self._dynamic_ax.fill_between(t,0,self.rpm2,facecolor='#696969')
-        self._dynamic_ax.plot(0,0,color='#B0C4DE')
+    def closeEvent(self, event):
+        self.stop_worker()
+        event.accept()
+
+
+    def init_chart(self):
+        # the chart artists are created once; _update_canvas only swaps their data and blits
+        ax = self._dynamic_ax
+        self.chart_line, = ax.plot([],[],color='#696969',animated=True)
+        self.chart_fill = ax.fill_between([0],0,[0],facecolor='#696969',animated=True)
+        ax.plot(0,0,color='#B0C4DE')
         #self._dynamic_ax2.plot(t,self.rcf2,color='#B0C4DE')
         #self._dynamic_ax2.fill_between(t,0,self.rcf2,facecolor='#B0C4DE')
-        self._dynamic_ax.axvline(x=self.rotations,linewidth=2,c='r')
-        self._dynamic_ax.set_title('Centrifuge Spin Test')
-        self._dynamic_ax.set_ylabel('Radial Velocity, rpm')
-        self._dynamic_ax.set_xlabel('Number of Revolutions')
-        self._dynamic_ax.legend(['Tubes RPM','Tubes RCF'])
+        self.chart_cursor = ax.axvline(x=self.rotations,linewidth=2,c='r',animated=True)
+        ax.set_title('Centrifuge Spin Test')
+        ax.set_ylabel('Radial Velocity, rpm')
+        ax.set_xlabel('Number of Revolutions')
+        ax.legend(['Tubes RPM','Tubes RCF'])
         #self._dynamic_ax2.legend(['RCF'])
+        ax.grid()
+        ax.set_xlim(0, self.graph_x_size)
+        ax.set_ylim(0, self.chart_min_top)
+
+        self.chart_background = None
+        ax.figure.canvas.mpl_connect('draw_event', self.on_chart_draw)
+
 
-        self._dynamic_ax.grid()
-        #self._dynamic_ax.set_yticks(np.arange(-1.3, 1.6, step=0.2))
+    def on_chart_draw(self, event):
+        # a full redraw (first show, resize, new y-limits) refreshes the blit background;
+        # the artists are drawn into that frame, blitting here would repaint inside Qt's paintEvent
+        canvas = self._dynamic_ax.figure.canvas
+        self.chart_background = canvas.copy_from_bbox(self._dynamic_ax.bbox)
+        self.draw_chart_artists()
 
-        self._dynamic_ax.figure.canvas.draw()
 
+    def draw_chart_artists(self):
+        self._dynamic_ax.draw_artist(self.chart_fill)
+        self._dynamic_ax.draw_artist(self.chart_line)
+        self._dynamic_ax.draw_artist(self.chart_cursor)
+
+
+    def blit_chart(self):
+        canvas = self._dynamic_ax.figure.canvas
+        if self.chart_background is None:
+            canvas.draw()
+            return
+        canvas.restore_region(self.chart_background)
+        self.draw_chart_artists()
+        canvas.blit(self._dynamic_ax.bbox)
+
+
+    def _update_canvas(self):
         self.lbl_TIMER_seconds.setText(str(np.round(time.time()-self.spin_time,2))+" s")
-        self.lbl_BIG_RPM.setText(str(np.round(self.rpm,2))+" RPM")
+        self.lbl_BIG_RPM.setText(str(np.round(self.rpm,2))+" \u00b1 "+str(np.round(self.rpm_sigma,1))+" RPM")
         self.lbl_BIG_RCF.setText(str(np.round(self.rcf,2))+" RCF")
+        self.timings_tick = (self.timings_tick+1) % 10
+        if self.timings_tick == 0 and self.timer is not None:
+            self.lbl_TIMINGS.setText(self.timer.format()+"\ndropped frames {}".format(self.dropped_frames))
+            self.lbl_ROTORS.setText('\n'.join("{:<10}{:>9.1f} RPM{:>9.1f} RCF{:>6} rev".format(rotor.name, rpm, rcf, len(history))
+                                               for rotor, (rpm, rcf), history in zip(self.rotors, self.rotor_values, self.rotor_histories)))
+            fps = self.worker.measured_fps() if self.worker is not None else None
+            if fps is not None:
+                self.lbl_CAM_FPS.setText("measured {:.1f} fps".format(fps))
+
+        # nothing to redraw until a new revolution arrives
+        if self.chart_version == self.chart_drawn_version:
+            return
+        self.chart_drawn_version = self.chart_version
+
+        # one min/max pair per pixel column at most, however long the session is
+        buckets = max(int(self._dynamic_ax.bbox.width), self.graph_x_size)
+        t, rpm = self.history.decimated('rpm', buckets)
+        self.chart_line.set_data(t, rpm)
+        self.chart_fill.set_verts([np.column_stack((np.r_[t[0], t, t[-1]], np.r_[0, rpm, 0]))])
+        self.chart_cursor.set_xdata([self.rotations, self.rotations])
+
+        # rescale (full redraw) only when the data leaves the current range or shrinks well below it
+        right = self._dynamic_ax.get_xlim()[1]
+        top = self._dynamic_ax.get_ylim()[1]
+        wanted = max(self.chart_min_top, 1.2*rpm.max())
+        if self.rotations > right or rpm.max() > top or wanted < top/2:
+            while right < self.rotations:
+                right = 2*right
+            self._dynamic_ax.set_xlim(0, right)
+            self._dynamic_ax.set_ylim(0, wanted)
+            self._dynamic_ax.figure.canvas.draw()
+        else:
+            self.blit_chart()
 
 
 